@@ -0,0 +1,126 @@
+import optparse
+import os
+import subprocess
+import sys
+import time
+
+
+USAGE = """%prog SDK_PATH [--resources N] [--warmup]
+Measure the cold start cost of a sample Zenn-La app.
+
+Reports the time taken to import zennla.viewsets and zennla.routers in a
+fresh interpreter, and the latency of the first and second requests to an
+app routing N viewsets (50 by default).
+
+SDK_PATH    Path to Google Cloud or Google App Engine SDK installation, usually
+            ~/google_cloud_sdk"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_path(sdk_path):
+    if os.path.exists(os.path.join(sdk_path, 'platform/google_appengine')):
+        sdk_path = os.path.join(sdk_path, 'platform/google_appengine')
+    sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, ROOT)
+
+
+def measure_import(sdk_path):
+    """
+    Print the time taken to import the zennla modules an app routes with
+    Run in a fresh interpreter by `main()`
+    """
+    setup_path(sdk_path)
+    start = time.time()
+    import zennla.viewsets
+    import zennla.routers
+    (zennla.viewsets, zennla.routers)
+    print (time.time() - start) * 1000
+
+
+def build_app(resources):
+    """
+    Return a WSGIApplication routing `resources` model viewsets
+    """
+    import webapp2
+    from google.appengine.ext import ndb
+    from zennla.renderers import JSONRenderer, XMLRenderer
+    from zennla.routers import route, warmup
+    from zennla.serializers import ModelSerializer
+    from zennla.viewsets import ModelViewSet
+
+    routes = [warmup()]
+    for index in range(resources):
+        model = type('Resource%d' % index, (ndb.Model,), {
+            'name': ndb.StringProperty(),
+            'number': ndb.IntegerProperty()
+        })
+        serializer = type('Resource%dSerializer' % index, (
+            ModelSerializer,
+        ), {'model': model})
+        viewset = type('Resource%dViewSet' % index, (ModelViewSet,), {
+            'serializer_class': serializer,
+            'renderers': [JSONRenderer, XMLRenderer]
+        })
+        model(name='resource', number=index).put()
+        routes.append(route('/resource%d' % index, viewset))
+    return webapp2.WSGIApplication(routes)
+
+
+def request(app, path):
+    import webapp2
+    start = time.time()
+    response = webapp2.Request.blank(path).get_response(app)
+    assert response.status_int == 200, response.status
+    return (time.time() - start) * 1000
+
+
+def main(sdk_path, resources, warm):
+    import_times = [
+        float(subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), '--import-only',
+            sdk_path
+        ]))
+        for _ in range(5)
+    ]
+    print 'Import zennla.viewsets, zennla.routers: %.1f ms (best of 5)' % (
+        min(import_times)
+    )
+
+    setup_path(sdk_path)
+    from google.appengine.ext import ndb
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    ndb.get_context().clear_cache()
+    try:
+        app = build_app(resources)
+        if warm:
+            print 'Warmup request: %.1f ms' % request(app, '/_ah/warmup')
+        last = '/resource%d/' % (resources - 1)
+        print 'First request (%d routed viewsets): %.1f ms' % (
+            resources, request(app, last)
+        )
+        print 'Second request: %.1f ms' % request(app, last)
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(USAGE)
+    parser.add_option('--resources', type='int', default=50)
+    parser.add_option('--warmup', action='store_true', default=False)
+    parser.add_option('--import-only', action='store_true', default=False)
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        print 'Error: Exactly 1 argument required.'
+        parser.print_help()
+        sys.exit(1)
+    if options.import_only:
+        measure_import(args[0])
+    else:
+        main(args[0], options.resources, options.warmup)
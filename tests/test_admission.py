@@ -0,0 +1,202 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import time
+import unittest
+
+import webapp2
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla.admission import ConcurrencyLimit, TokenBucket
+from zennla.exceptions import (
+    ServiceUnavailable, TooManyRequests, ValidationError
+)
+from zennla.routers import route
+from zennla.serializers import ModelSerializer
+from zennla.viewsets import ModelViewSet
+
+
+class AdmittedModel(ndb.Model):
+    name = ndb.StringProperty()
+
+
+class AdmittedSerializer(ModelSerializer):
+    model = AdmittedModel
+
+
+class LimitedViewSet(ModelViewSet):
+    serializer_class = AdmittedSerializer
+    admission_controls = {
+        'list': [ConcurrencyLimit(1, retry_after=2)],
+        'retrieve': [TokenBucket(rate=1, burst=1)]
+    }
+    error = None
+
+    def list(self, *args, **kwargs):
+        if LimitedViewSet.error is not None:
+            raise LimitedViewSet.error
+        super(LimitedViewSet, self).list(*args, **kwargs)
+
+
+class FailedRPC(object):
+
+    def get_result(self):
+        return None
+
+
+class UnavailableClient(object):
+    """
+    A memcache client whose calls all fail
+    """
+    def gets(self, key):
+        return None
+
+    def add_multi_async(self, mapping, time=0):
+        return FailedRPC()
+
+    def cas_multi_async(self, mapping, time=0):
+        return FailedRPC()
+
+
+class ContendedClient(memcache.Client):
+    """
+    A memcache client whose bucket is always updated by another request
+    between its reads and its writes
+    """
+    def cas_multi_async(self, mapping, time=0):
+        for key, value in mapping.iteritems():
+            memcache.set(key, value)
+        return super(ContendedClient, self).cas_multi_async(mapping, time)
+
+
+class AdmissionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        self.client_class = memcache.Client
+
+    def tearDown(self):
+        memcache.Client = self.client_class
+        self.testbed.deactivate()
+
+    def test_concurrency_limit(self):
+        control = ConcurrencyLimit(2, retry_after=3)
+        releases = [control.admit('key'), control.admit('key')]
+        with self.assertRaises(ServiceUnavailable) as context:
+            control.admit('key')
+        self.assertEqual(context.exception.retry_after, 3)
+        releases[0]()
+        control.admit('key')
+        self.assertIsNotNone(memcache.get(control.key_prefix +
+                                          'concurrency:key'))
+
+    def test_concurrency_limit_release_is_idempotent(self):
+        control = ConcurrencyLimit(2)
+        release = control.admit('key')
+        control.admit('key')
+        release()
+        release()
+        control.admit('key')
+        self.assertRaises(ServiceUnavailable, control.admit, 'key')
+
+    def test_concurrency_limit_leases_expire(self):
+        control = ConcurrencyLimit(1, lease_time=0.1)
+        control.admit('key')
+        self.assertRaises(ServiceUnavailable, control.admit, 'key')
+        time.sleep(0.15)
+        release = control.admit('key')
+        self.assertRaises(ServiceUnavailable, control.admit, 'key')
+        release()
+        control.admit('key')
+
+    def test_concurrency_limit_rejects_on_contention(self):
+        memcache.Client = ContendedClient
+        control = ConcurrencyLimit(10)
+        control.admit('key')
+        self.assertRaises(ServiceUnavailable, control.admit, 'key')
+        self.assertEqual(control._local_counts, {})
+
+    def test_concurrency_limit_local_fallback(self):
+        memcache.Client = UnavailableClient
+        control = ConcurrencyLimit(1)
+        release = control.admit('key')
+        self.assertRaises(ServiceUnavailable, control.admit, 'key')
+        release()
+        control.admit('key')
+
+    def test_token_bucket(self):
+        control = TokenBucket(rate=1, burst=2)
+        control.admit('key')
+        control.admit('key')
+        with self.assertRaises(TooManyRequests) as context:
+            control.admit('key')
+        self.assertGreater(context.exception.retry_after, 0)
+        self.assertLessEqual(context.exception.retry_after, 1)
+        self.assertEqual(control._local_buckets, {})
+
+    def test_token_bucket_rejects_on_contention(self):
+        memcache.Client = ContendedClient
+        control = TokenBucket(rate=100)
+        control.admit('key')
+        self.assertRaises(TooManyRequests, control.admit, 'key')
+        self.assertEqual(control._local_buckets, {})
+
+    def test_token_bucket_local_fallback(self):
+        memcache.Client = UnavailableClient
+        control = TokenBucket(rate=1, burst=2)
+        control.admit('key')
+        control.admit('key')
+        self.assertRaises(TooManyRequests, control.admit, 'key')
+        self.assertEqual(len(control._local_buckets), 1)
+
+
+class ViewSetAdmissionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.app = webapp2.WSGIApplication([route('/items', LimitedViewSet)])
+        self.obj = AdmittedSerializer().create({'name': 'first'})
+        LimitedViewSet.error = None
+
+    def tearDown(self):
+        LimitedViewSet.error = None
+        self.testbed.deactivate()
+
+    def get(self, path):
+        return webapp2.Request.blank(path).get_response(self.app)
+
+    def test_concurrency_limit(self):
+        control = LimitedViewSet.admission_controls['list'][0]
+        release = control.admit('{module}.LimitedViewSet:list:0'.format(
+            module=LimitedViewSet.__module__
+        ))
+        response = self.get('/items/')
+        self.assertEqual(response.status_int, 503)
+        self.assertEqual(response.headers['Retry-After'], '2')
+        release()
+        self.assertEqual(self.get('/items/').status_int, 200)
+
+    def test_token_bucket(self):
+        path = '/items/{id}'.format(id=self.obj.key.id())
+        self.assertEqual(self.get(path).status_int, 200)
+        response = self.get(path)
+        self.assertEqual(response.status_int, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_released_on_exceptions(self):
+        LimitedViewSet.error = ValidationError("Invalid request")
+        self.assertEqual(self.get('/items/').status_int, 400)
+        LimitedViewSet.error = RuntimeError()
+        self.assertEqual(self.get('/items/').status_int, 500)
+        LimitedViewSet.error = None
+        self.assertEqual(self.get('/items/').status_int, 200)
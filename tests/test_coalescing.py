@@ -0,0 +1,86 @@
+import threading
+import time
+import unittest
+
+import webapp2
+from zennla.coalescing import SingleFlight, get_request_key
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.outcomes = []
+        self.followers = []
+
+    def follow(self, key='key', timeout=None):
+        try:
+            self.outcomes.append(
+                self.flights.do(key, lambda: 'own', timeout=timeout)
+            )
+        except Exception as e:
+            self.outcomes.append(e)
+
+    def start_followers(self, count, **kwargs):
+        for _ in range(count):
+            thread = threading.Thread(target=self.follow, kwargs=kwargs)
+            thread.start()
+            self.followers.append(thread)
+        # Give the followers time to start waiting on the call in flight
+        time.sleep(0.1)
+
+    def join_followers(self):
+        for thread in self.followers:
+            thread.join()
+
+    def test_followers_share_result(self):
+        def lead():
+            self.start_followers(3)
+            return 'shared'
+        self.assertEqual(self.flights.do('key', lead), 'shared')
+        self.join_followers()
+        self.assertEqual(self.outcomes, ['shared'] * 3)
+
+    def test_followers_share_error(self):
+        error = ValueError('failed')
+
+        def lead():
+            self.start_followers(2)
+            raise error
+        self.assertRaises(ValueError, self.flights.do, 'key', lead)
+        self.join_followers()
+        self.assertEqual(self.outcomes, [error, error])
+
+    def test_timeout_computes_independently(self):
+        def lead():
+            self.start_followers(1, timeout=0.01)
+            return 'shared'
+        self.assertEqual(self.flights.do('key', lead), 'shared')
+        self.join_followers()
+        self.assertEqual(self.outcomes, ['own'])
+
+    def test_distinct_keys_are_not_coalesced(self):
+        def lead():
+            self.start_followers(1, key='other')
+            return 'shared'
+        self.assertEqual(self.flights.do('key', lead), 'shared')
+        self.join_followers()
+        self.assertEqual(self.outcomes, ['own'])
+
+
+class RequestKeyTestCase(unittest.TestCase):
+
+    def get_key(self, url, headers=None):
+        return get_request_key(webapp2.Request.blank(url, headers=headers))
+
+    def test_query_parameters_are_sorted(self):
+        self.assertEqual(
+            self.get_key('/items/?b=2&a=1'), self.get_key('/items/?a=1&b=2')
+        )
+
+    def test_host_and_vary_headers_are_part_of_the_key(self):
+        key = self.get_key('http://one.example.com/items/')
+        self.assertNotEqual(key, self.get_key('http://two.example.com/items/'))
+        self.assertNotEqual(key, self.get_key(
+            'http://one.example.com/items/', {'Accept': 'text/csv'}
+        ))
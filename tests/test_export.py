@@ -0,0 +1,99 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import unittest
+import json
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla.export import Exporter, split_key_ranges
+from zennla.renderers import CSVRenderer
+from zennla.serializers import ModelSerializer
+
+
+class ExportModel(ndb.Model):
+    number = ndb.IntegerProperty()
+    text = ndb.StringProperty()
+
+
+class ExportSerializer(ModelSerializer):
+    model = ExportModel
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.keys = ndb.put_multi([
+            ExportModel(number=number, text='text %d' % number)
+            for number in range(10)
+        ])
+        self.exporter = Exporter(
+            ExportSerializer, shard_count=3, batch_size=2
+        )
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_split_key_ranges(self):
+        key_ranges = split_key_ranges(ExportModel, 3)
+        self.assertEqual(len(key_ranges), 3)
+        self.assertIsNone(key_ranges[0][0])
+        self.assertIsNone(key_ranges[-1][1])
+        for (_, end_key), (start_key, _) in zip(
+            key_ranges[:-1], key_ranges[1:]
+        ):
+            self.assertEqual(end_key, start_key)
+
+    def test_export_json_lines(self):
+        job = self.exporter.start()
+        self.exporter.run(job, max_workers=1)
+        rows = [
+            json.loads(line)
+            for line in self.exporter.get_output(job).splitlines()
+        ]
+        self.assertEqual(
+            sorted(row['id'] for row in rows),
+            sorted(key.id() for key in self.keys)
+        )
+
+    def test_export_csv(self):
+        exporter = Exporter(ExportSerializer, renderer_class=CSVRenderer)
+        job = exporter.start()
+        exporter.run(job)
+        lines = exporter.get_output(job).splitlines()
+        self.assertEqual(lines[0], 'id,number,text')
+        self.assertEqual(len(lines), len(self.keys) + 1)
+
+    def test_progress_and_resume(self):
+        job = self.exporter.start()
+        first_shard = self.exporter.get_shards(job)[0]
+        self.exporter.run_shard(first_shard.key)
+        progress = self.exporter.get_progress(job)
+        self.assertEqual(progress['done'], 1)
+        self.assertFalse(progress['complete'])
+
+        self.exporter.run(job)
+        progress = self.exporter.get_progress(job)
+        self.assertTrue(progress['complete'])
+        self.assertEqual(progress['exported'], len(self.keys))
+
+    def test_output_fetched_in_batches(self):
+        exporter = Exporter(ExportSerializer, shard_count=1, batch_size=1)
+        job = exporter.start()
+        exporter.run(job)
+        self.assertEqual(exporter.get_shards(job)[0].chunk_count, 10)
+        rows = [
+            json.loads(line)
+            for line in ''.join(
+                exporter.iter_output(job, batch_size=3)
+            ).splitlines()
+        ]
+        self.assertEqual(
+            [row['id'] for row in rows], sorted(key.id() for key in self.keys)
+        )
@@ -0,0 +1,213 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import json
+import unittest
+
+import webapp2
+from google.appengine.ext import testbed
+from zennla import profiling
+from zennla.profiling import Profiler
+from zennla.routers import profiling as profiling_route
+
+
+class FakeStatistic(object):
+
+    def __init__(self, count):
+        self.count = count
+
+
+class FakeTracemalloc(object):
+    """
+    Traces 100 bytes (in 3 blocks) more on every reading
+    """
+    def __init__(self, tracing=False):
+        self.tracing = tracing
+        self.calls = []
+        self.memory = 0
+
+    def is_tracing(self):
+        return self.tracing
+
+    def start(self):
+        self.calls.append('start')
+        self.tracing = True
+
+    def stop(self):
+        self.calls.append('stop')
+        self.tracing = False
+
+    def get_traced_memory(self):
+        self.memory += 100
+        return self.memory, 1000
+
+    def take_snapshot(self):
+        self.calls.append('take_snapshot')
+        snapshot = type('Snapshot', (object,), {})()
+        snapshot.statistics = lambda key_type: [
+            FakeStatistic(1), FakeStatistic(2)
+        ]
+        return snapshot
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler()
+        self.tracemalloc = profiling.tracemalloc
+        self.get_memory_usage = profiling._get_memory_usage
+        # Measure memory with a fake instance memory usage growing by
+        # 100 bytes on every reading
+        profiling.tracemalloc = None
+        usage = []
+
+        def get_memory_usage():
+            usage.append(len(usage) * 100)
+            return usage[-1]
+        profiling._get_memory_usage = get_memory_usage
+
+    def tearDown(self):
+        profiling.tracemalloc = self.tracemalloc
+        profiling._get_memory_usage = self.get_memory_usage
+
+    def record(self, route, measurements):
+        profile = self.profiler.start(route)
+        profile.measurements = measurements
+        profile.finish()
+
+    def test_stage(self):
+        profile = self.profiler.start('GET /items/')
+        with profile.stage('fetch'):
+            objects = [object() for _ in range(10)]
+        with profile.stage('render'):
+            pass
+        self.assertEqual(
+            [stage for stage, _ in profile.measurements], ['fetch', 'render']
+        )
+        fetch = profile.measurements[0][1]
+        self.assertEqual(
+            (fetch['allocated_bytes'], fetch['peak_bytes']), (100, 100)
+        )
+        self.assertGreaterEqual(fetch['seconds'], 0)
+        self.assertEqual(len(objects), 10)
+        profile.finish()
+
+    def test_stage_counts_allocations(self):
+        profile = self.profiler.start('GET /items/')
+        with profile.stage('fetch'):
+            objects = [[] for _ in range(5000)]
+        # A net count: objects freed during the stage are deducted
+        self.assertGreater(profile.measurements[0][1]['objects'], 4500)
+        self.assertEqual(len(objects), 5000)
+        profile.finish()
+
+    def test_stage_traces_its_own_allocations(self):
+        profiling.tracemalloc = FakeTracemalloc()
+        profile = self.profiler.start('GET /items/')
+        with profile.stage('fetch'):
+            pass
+        fetch = profile.measurements[0][1]
+        self.assertEqual(
+            (fetch['allocated_bytes'], fetch['peak_bytes'], fetch['objects']),
+            (100, 1000, 3)
+        )
+        self.assertEqual(
+            profiling.tracemalloc.calls, ['start', 'take_snapshot', 'stop']
+        )
+        profile.finish()
+
+    def test_stage_keeps_tracing_of_the_app(self):
+        profiling.tracemalloc = FakeTracemalloc(tracing=True)
+        profile = self.profiler.start('GET /items/')
+        with profile.stage('fetch'):
+            pass
+        fetch = profile.measurements[0][1]
+        self.assertEqual(
+            (fetch['allocated_bytes'], fetch['peak_bytes']), (100, 100)
+        )
+        self.assertTrue(profiling.tracemalloc.is_tracing())
+        self.assertEqual(profiling.tracemalloc.calls, [])
+        profile.finish()
+
+    def test_stage_records_failed_stage(self):
+        profile = self.profiler.start('GET /items/')
+        with self.assertRaises(ValueError):
+            with profile.stage('fetch'):
+                raise ValueError()
+        self.assertEqual(profile.measurements[0][0], 'fetch')
+        profile.finish()
+
+    def test_one_profile_at_a_time(self):
+        profile = self.profiler.start('GET /items/')
+        self.assertIsNone(self.profiler.start('GET /items/'))
+        profile.finish()
+        self.assertIsNotNone(self.profiler.start('GET /items/'))
+
+    def test_get_stats(self):
+        self.record('GET /items/', [
+            ('fetch', {'allocated_bytes': 100, 'seconds': 1}),
+            ('render', {'allocated_bytes': 10, 'seconds': 2})
+        ])
+        self.record('GET /items/', [
+            ('fetch', {'allocated_bytes': 300, 'seconds': 3})
+        ])
+        self.record('GET /items/1', [
+            ('fetch', {'allocated_bytes': 50, 'seconds': 1})
+        ])
+        stats = self.profiler.get_stats()
+        self.assertEqual(stats['GET /items/'], {
+            'requests': 2,
+            'stages': {
+                'fetch': {
+                    'allocated_bytes': {'mean': 200, 'max': 300},
+                    'seconds': {'mean': 2, 'max': 3}
+                },
+                'render': {
+                    'allocated_bytes': {'mean': 5, 'max': 10},
+                    'seconds': {'mean': 1, 'max': 2}
+                }
+            }
+        })
+        self.assertEqual(stats['GET /items/1']['requests'], 1)
+
+        self.profiler.reset()
+        self.assertEqual(self.profiler.get_stats(), {})
+
+
+class ProfilingHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_user_stub()
+        self.app = webapp2.WSGIApplication([profiling_route()])
+        profiling.profiler.reset()
+
+    def tearDown(self):
+        profiling.profiler.reset()
+        self.testbed.deactivate()
+
+    def request(self, method='GET', admin=False):
+        self.testbed.setup_env(
+            user_email='trainer@example.com', user_id='1',
+            user_is_admin='1' if admin else '0', overwrite=True
+        )
+        return webapp2.Request.blank(
+            '/_zennla/profiling', method=method
+        ).get_response(self.app)
+
+    def test_non_admins_are_forbidden(self):
+        self.assertEqual(self.request().status_int, 403)
+        self.assertEqual(self.request('DELETE').status_int, 403)
+
+    def test_admins_get_stats(self):
+        profile = profiling.profiler.start('GET /items/')
+        profile.measurements = [('fetch', {'seconds': 1})]
+        profile.finish()
+        response = self.request(admin=True)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(
+            json.loads(response.body)['GET /items/']['requests'], 1
+        )
+        self.assertEqual(self.request('DELETE', admin=True).status_int, 204)
+        self.assertEqual(profiling.profiler.get_stats(), {})
@@ -0,0 +1,111 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla import querycache
+from zennla.serializers import ModelSerializer
+from zennla.writebehind import WriteBehindBuffer
+
+
+class CachedModel(ndb.Model):
+    number = ndb.IntegerProperty()
+    name = ndb.StringProperty()
+
+
+class CachedSerializer(ModelSerializer):
+    model = CachedModel
+
+
+class WriteBehindCachedSerializer(CachedSerializer):
+    write_behind = WriteBehindBuffer(max_delay=60)
+
+
+class QueryCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.serializer = CachedSerializer()
+        self.objs = [
+            self.serializer.create({'number': number}) for number in range(3)
+        ]
+        self.query = CachedModel.query().order(CachedModel.number)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_fetch(self):
+        self.assertEqual(querycache.fetch(self.query), self.objs)
+
+    def get_generation(self):
+        return querycache.get_generation(CachedModel._get_kind())
+
+    def test_update_reuses_cached_keys(self):
+        querycache.fetch(self.query)
+        generation = self.get_generation()
+        self.serializer.update(
+            {'number': 0, 'name': 'first'}, id=self.objs[0].key.id()
+        )
+        self.assertEqual(self.get_generation(), generation)
+        self.assertEqual(
+            [obj.name for obj in querycache.fetch(self.query)],
+            ['first', None, None]
+        )
+
+    def test_update_of_ordered_property_invalidates_cached_keys(self):
+        querycache.fetch(self.query)
+        self.serializer.update({'number': 10}, id=self.objs[0].key.id())
+        self.assertEqual(
+            [obj.number for obj in querycache.fetch(self.query)],
+            [1, 2, 10]
+        )
+
+    def test_update_of_filtered_property_invalidates_cached_keys(self):
+        query = CachedModel.query(CachedModel.number < 2)
+        querycache.fetch(query)
+        self.serializer.update({'number': 10}, id=self.objs[0].key.id())
+        self.serializer.update({'number': 1}, id=self.objs[2].key.id())
+        self.assertEqual(
+            sorted(obj.key for obj in querycache.fetch(query)),
+            [self.objs[1].key, self.objs[2].key]
+        )
+
+    def test_query_properties(self):
+        self.assertEqual(
+            querycache.get_query_properties(CachedModel.query(ndb.OR(
+                CachedModel.number == 1, CachedModel.name == 'first'
+            )).order(-CachedModel.number)),
+            set(['number', 'name'])
+        )
+
+    def test_write_behind_flush_invalidates_cached_keys(self):
+        querycache.fetch(self.query)
+        serializer = WriteBehindCachedSerializer()
+        serializer.update({'number': 10}, id=self.objs[0].key.id())
+        try:
+            serializer.write_behind.flush()
+        finally:
+            serializer.write_behind.stop()
+        self.assertEqual(
+            [obj.number for obj in querycache.fetch(self.query)],
+            [1, 2, 10]
+        )
+
+    def test_insert_invalidates_cached_keys(self):
+        querycache.fetch(self.query)
+        obj = self.serializer.create({'number': 5})
+        self.assertEqual(querycache.fetch(self.query), self.objs + [obj])
+
+    def test_delete_invalidates_cached_keys(self):
+        querycache.fetch(self.query)
+        self.serializer.delete(self.objs[1])
+        self.assertEqual(
+            querycache.fetch(self.query), [self.objs[0], self.objs[2]]
+        )
@@ -0,0 +1,159 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import json
+import unittest
+
+import webapp2
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla.exceptions import ImproperlyConfigured
+from zennla.routers import TrieRouter, to_key
+from zennla.serializers import ModelSerializer
+from zennla.viewsets import ModelViewSet
+
+
+class Region(ndb.Model):
+    name = ndb.StringProperty()
+
+
+class Trainer(ndb.Model):
+    name = ndb.StringProperty()
+
+
+class RegionViewSet(ModelViewSet):
+    serializer_class = type('RegionSerializer', (ModelSerializer,), {
+        'model': Region
+    })
+
+
+class TrainerViewSet(ModelViewSet):
+    serializer_class = type('TrainerSerializer', (ModelSerializer,), {
+        'model': Trainer
+    })
+
+
+class EchoHandler(webapp2.RequestHandler):
+
+    def get(self, **kwargs):
+        self.response.write(repr(kwargs))
+
+
+class TrieRouterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.router = TrieRouter()
+        self.router.register('/pokemon', EchoHandler)
+        self.router.register('/pokemon/legendary', EchoHandler)
+        self.router.register(
+            '/trainers', EchoHandler, detail_field='name',
+            detail_type='string'
+        )
+        self.app = webapp2.WSGIApplication([self.router])
+
+    def get(self, path, method='GET'):
+        return webapp2.Request.blank(path, method=method).get_response(
+            self.app
+        )
+
+    def test_list(self):
+        response = self.get('/pokemon/')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.body, '{}')
+
+    def test_detail_int(self):
+        self.assertEqual(self.get('/pokemon/25').body, "{'id': 25}")
+
+    def test_detail_int_rejects_non_digits(self):
+        self.assertEqual(self.get('/pokemon/pikachu').status_int, 404)
+
+    def test_detail_string(self):
+        self.assertEqual(
+            self.get('/trainers/ash%20ketchum').body,
+            "{'name': u'ash ketchum'}"
+        )
+
+    def test_static_segment_precedence(self):
+        self.assertEqual(self.get('/pokemon/legendary/').body, '{}')
+        self.assertEqual(self.get('/pokemon/legendary/150').body,
+                         "{'id': 150}")
+
+    def test_unknown_path(self):
+        self.assertEqual(self.get('/items/').status_int, 404)
+        self.assertEqual(self.get('/pokemon/25/moves').status_int, 404)
+
+    def test_method_not_allowed(self):
+        self.assertEqual(self.get('/pokemon/', method='DELETE').status_int,
+                         405)
+
+    def test_uri_for(self):
+        request = webapp2.Request.blank('/')
+        request.app = self.app
+        self.assertEqual(
+            self.app.router.build(request, '/pokemon-detail', (), {
+                'id': 25, 'fields': 'name'
+            }),
+            '/pokemon/25?fields=name'
+        )
+
+    def test_register_twice(self):
+        self.assertRaises(
+            ImproperlyConfigured, self.router.register, '/pokemon',
+            EchoHandler
+        )
+
+    def test_invalid_detail_type(self):
+        self.assertRaises(
+            ImproperlyConfigured, self.router.register, '/items',
+            EchoHandler, detail_type='float'
+        )
+
+    def test_to_key(self):
+        key = ndb.Key('Trainer', 5)
+        self.assertEqual(to_key(key.urlsafe()), key)
+        self.assertRaises(ValueError, to_key, 'not-a-key')
+
+
+class TrieRouterViewSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        router = TrieRouter()
+        router.register(
+            '/regions', RegionViewSet, detail_field='name',
+            detail_type='string'
+        )
+        router.register('/trainers', TrainerViewSet, detail_type='key')
+        self.app = webapp2.WSGIApplication([router])
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def get(self, path):
+        return webapp2.Request.blank(path).get_response(self.app)
+
+    def test_string_id_made_of_digits(self):
+        Region(id='151', name='Kanto').put()
+        Region(id=151, name='Johto').put()
+        response = self.get('/regions/151')
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(json.loads(response.body)['name'], 'Kanto')
+
+    def test_key(self):
+        key = Trainer(name='Ash').put()
+        response = self.get('/trainers/{key}'.format(key=key.urlsafe()))
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(json.loads(response.body)['name'], 'Ash')
+
+    def test_key_of_another_kind(self):
+        key = Region(id='kanto', name='Kanto').put()
+        response = self.get('/trainers/{key}'.format(key=key.urlsafe()))
+        self.assertEqual(response.status_int, 400)
+
+    def test_invalid_key(self):
+        self.assertEqual(self.get('/trainers/not-a-key').status_int, 404)
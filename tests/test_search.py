@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import json
+import unittest
+
+import webapp2
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla.exceptions import ImproperlyConfigured, ValidationError
+from zennla.filters import FilterSet, SearchFilter
+from zennla.routers import route
+from zennla.search import SearchIndex, tokenize
+from zennla.serializers import ModelSerializer
+from zennla.viewsets import ModelViewSet
+
+
+class Pokemon(object):
+
+    def __init__(self, name, moves):
+        self.name = name
+        self.moves = moves
+
+
+class SearchModel(ndb.Model):
+    name = ndb.StringProperty()
+    terms = ndb.StringProperty(repeated=True)
+
+
+class SearchSerializer(ModelSerializer):
+    model = SearchModel
+    search_index = SearchIndex(
+        ['name'], index_field='terms', min_prefix_length=2
+    )
+
+
+class SearchFilterSet(FilterSet):
+    q = SearchFilter(SearchModel.terms, SearchSerializer.search_index)
+
+    class Meta:
+        filters = ['q']
+
+
+class SearchViewSet(ModelViewSet):
+    serializer_class = SearchSerializer
+    filter_backends = [SearchFilterSet]
+
+
+class SearchIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SearchIndex(
+            ['name', 'moves'], min_prefix_length=2, max_prefix_length=4
+        )
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize(u'Flabébé, Mr. Mime'), [u'flabebe', u'mr', u'mime']
+        )
+
+    def test_build(self):
+        self.assertEqual(
+            self.index.build(Pokemon('Pikachu', ['Thunder Shock', None])),
+            ['pi', 'pik', 'pika', 'sh', 'sho', 'shoc', 'th', 'thu', 'thun']
+        )
+
+    def test_build_empty(self):
+        self.assertEqual(self.index.build(Pokemon(None, [])), [])
+
+    def test_get_terms(self):
+        self.assertEqual(
+            self.index.get_terms('PIKACHU t thun'), ['pika', 'thun']
+        )
+
+
+class SearchFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.filter = SearchFilterSet.q
+
+    def test_get_filter(self):
+        self.assertEqual(
+            self.filter.get_filter(u'Pikachu'), SearchModel.terms == u'pikachu'
+        )
+        self.assertEqual(
+            self.filter.get_filter(u'PIKA t Éle'), ndb.AND(
+                SearchModel.terms == u'ele', SearchModel.terms == u'pika'
+            )
+        )
+
+    def test_get_filter_without_terms(self):
+        self.assertRaises(ValidationError, self.filter.get_filter, u'a !')
+
+    def test_index_field_mismatch(self):
+        self.assertRaises(
+            ImproperlyConfigured, SearchFilter, SearchModel.name,
+            SearchSerializer.search_index
+        )
+
+
+class SearchViewSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.app = webapp2.WSGIApplication([route('/items', SearchViewSet)])
+        serializer = SearchSerializer()
+        for name in [u'Pikachu', u'Pichu', u'Électrode']:
+            serializer.create({'name': name})
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def search(self, terms):
+        return webapp2.Request.blank(
+            '/items/?q={terms}'.format(terms=terms)
+        ).get_response(self.app)
+
+    def get_names(self, terms):
+        response = self.search(terms)
+        self.assertEqual(response.status_int, 200)
+        return sorted(obj['name'] for obj in json.loads(response.body))
+
+    def test_list_search(self):
+        self.assertEqual(self.get_names('pi'), [u'Pichu', u'Pikachu'])
+        self.assertEqual(self.get_names('PIKA'), [u'Pikachu'])
+        self.assertEqual(self.get_names('%C3%A9lec'), [u'Électrode'])
+        self.assertEqual(self.get_names('pi%20chu'), [])
+        self.assertEqual(self.search('p').status_int, 400)
@@ -6,7 +6,11 @@ import json
 
 from google.appengine.ext import ndb
 from google.appengine.ext import testbed
+from zennla.search import SearchIndex
+from zennla.exceptions import ValidationError
 from zennla.serializers import ModelSerializer
+from zennla.sync import Tombstone
+from zennla.writebehind import WriteBehindBuffer, additive
 
 
 class TestModel(ndb.Model):
@@ -14,10 +18,33 @@ class TestModel(ndb.Model):
     text = ndb.StringProperty()
 
 
+class SyncTestModel(TestModel):
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+class SearchTestModel(TestModel):
+    search_index = ndb.StringProperty(repeated=True)
+
+
 class TestSerializer(ModelSerializer):
     model = TestModel
 
 
+class SyncTestSerializer(ModelSerializer):
+    model = SyncTestModel
+    sync_field = 'updated'
+
+
+class SearchTestSerializer(ModelSerializer):
+    model = SearchTestModel
+    search_index = SearchIndex(['text'], max_prefix_length=3)
+
+
+class WriteBehindTestSerializer(TestSerializer):
+    write_behind = WriteBehindBuffer(max_pending=10, max_delay=60)
+    merge_fields = {'number': additive}
+
+
 class SerializerTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -74,6 +101,22 @@ class SerializerTestCase(unittest.TestCase):
             TestModel.get_by_id(key.id())
         )
 
+    def test_get_obj_digit_string_id(self):
+        key = TestModel(**self.sample_data).put()
+        named_key = TestModel(id=u'5', **self.sample_data).put()
+        self.assertEqual(
+            self.test_serializer.get_obj(id=str(key.id())).key, key
+        )
+        self.assertEqual(self.test_serializer.get_obj(id=u'5').key, named_key)
+
+    def test_get_obj_key(self):
+        key = TestModel(**self.sample_data).put()
+        self.assertEqual(self.test_serializer.get_obj(id=key).key, key)
+        self.assertRaises(
+            ValidationError, self.test_serializer.get_obj,
+            id=ndb.Key('OtherModel', key.id())
+        )
+
     def test_create(self):
         count_before_create = TestModel.query(*(
             self.dict_to_filters()
@@ -98,3 +141,54 @@ class SerializerTestCase(unittest.TestCase):
         dict_repr = dict(self.sample_data)
         dict_repr.update({'id': key.id()})
         self.assertEqual(dict_repr, self.test_serializer.serialize(key.get()))
+
+    def test_serialize_list(self):
+        key = TestModel(**self.sample_data).put()
+        dict_repr = dict(self.sample_data)
+        dict_repr.update({'id': key.id()})
+        self.assertEqual(
+            [dict_repr], self.test_serializer.serialize([key.get()])
+        )
+
+    def test_delete(self):
+        key = TestModel(**self.sample_data).put()
+        self.test_serializer.delete(key.get())
+        self.assertIsNone(key.get())
+        self.assertEqual(Tombstone.query().count(), 0)
+
+    def test_delete_writes_tombstone(self):
+        key = SyncTestModel(**self.sample_data).put()
+        SyncTestSerializer().delete(key.get())
+        self.assertIsNone(key.get())
+        tombstone = Tombstone.query().get()
+        self.assertEqual(tombstone.kind, 'SyncTestModel')
+        self.assertEqual(tombstone.entity_id, key.id())
+
+    def test_write_behind_update(self):
+        serializer = WriteBehindTestSerializer()
+        key = TestModel(**self.sample_data).put()
+        updated = serializer.update({'number': 2}, id=key.id())
+        self.assertEqual(updated.number, 3)
+        self.assertEqual(updated.text, 'test_text')
+        serializer.update({'number': 4, 'text': 'new_text'}, id=key.id())
+
+        # Buffered updates are visible to readers before they are flushed
+        self.assertEqual(key.get(use_cache=False).number, 1)
+        obj = serializer.get_obj(id=key.id())
+        self.assertEqual((obj.number, obj.text), (7, 'new_text'))
+
+        serializer.write_behind.flush()
+        obj = key.get(use_cache=False)
+        self.assertEqual((obj.number, obj.text), (7, 'new_text'))
+
+    def test_search_index(self):
+        serializer = SearchTestSerializer()
+        obj = serializer.create({'text': 'Hot Tea'})
+        self.assertEqual(
+            obj.key.get().search_index, ['h', 'ho', 'hot', 't', 'te', 'tea']
+        )
+        self.assertNotIn('search_index', serializer.serialize(obj))
+        self.assertEqual(
+            SearchTestModel.query(SearchTestModel.search_index == 'te').get(),
+            obj
+        )
@@ -0,0 +1,218 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import datetime
+import json
+import time
+import unittest
+
+import webapp2
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla import sync
+from zennla.exceptions import ValidationError
+from zennla.filters import FilterSet, StringFilter
+from zennla.routers import route
+from zennla.serializers import ModelSerializer
+from zennla.viewsets import ModelViewSet
+
+
+class SyncModel(ndb.Model):
+    number = ndb.IntegerProperty()
+    name = ndb.StringProperty()
+    updated = ndb.DateTimeProperty(auto_now=True)
+
+
+class SyncSerializer(ModelSerializer):
+    model = SyncModel
+    sync_field = 'updated'
+
+
+class NameFilterSet(FilterSet):
+    min_name = StringFilter(SyncModel.name, 'ge')
+
+    class Meta:
+        filters = ['min_name']
+
+
+class SyncViewSet(ModelViewSet):
+    serializer_class = SyncSerializer
+    filter_backends = [NameFilterSet]
+    sync_page_size = 2
+    sync_lag = 0
+
+
+class UnsyncedViewSet(ModelViewSet):
+    serializer_class = type('UnsyncedSerializer', (ModelSerializer,), {
+        'model': SyncModel
+    })
+
+
+class SyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.serializer = SyncSerializer()
+        self.objs = [
+            self.serializer.create({'number': number}) for number in range(5)
+        ]
+        self.query = SyncModel.query()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def get_all_changes(self, since, page_size=2, lag=0):
+        """
+        Follow the cursors of a sync from `since`
+        Return the changed entities, the deleted ids and the watermarks
+        of all the pages
+        """
+        changed, deleted, watermarks, cursor = [], [], [], None
+        while True:
+            changes = sync.get_changes(
+                self.query, SyncModel.updated, since, page_size,
+                cursor=cursor, lag=lag
+            )
+            changed.extend(changes['changed'])
+            deleted.extend(changes['deleted'])
+            watermarks.append(changes['watermark'])
+            cursor = changes['cursor']
+            if cursor is None:
+                return changed, deleted, watermarks
+
+    def test_first_sync_pages_through_everything(self):
+        changed, deleted, watermarks = self.get_all_changes('0')
+        self.assertEqual(changed, self.objs)
+        self.assertEqual(deleted, [])
+        self.assertEqual(len(watermarks), 3)
+        self.assertEqual(len(set(watermarks)), 1)
+
+    def test_sync_from_watermark(self):
+        watermark = self.get_all_changes('0')[2][-1]
+        time.sleep(0.01)
+        updated = self.serializer.update({'number': 10}, self.objs[1].key.id())
+        self.serializer.delete(self.objs[3])
+        changed, deleted, _ = self.get_all_changes(watermark)
+        self.assertEqual(changed, [updated])
+        self.assertEqual(deleted, [self.objs[3].key.id()])
+
+    def test_deleted_pages(self):
+        for obj in self.objs:
+            self.serializer.delete(obj)
+        changed, deleted, watermarks = self.get_all_changes('0')
+        self.assertEqual(changed, [])
+        self.assertEqual(deleted, [obj.key.id() for obj in self.objs])
+        self.assertEqual(len(watermarks), 3)
+
+    def test_watermark_lags_behind_the_sync(self):
+        start = datetime.datetime.utcnow()
+        watermark = sync.get_changes(
+            self.query, SyncModel.updated, '0', 10, lag=60
+        )['watermark']
+        self.assertLessEqual(
+            int(watermark),
+            int(sync.to_watermark(start - datetime.timedelta(seconds=59)))
+        )
+        # Changes within the lag are returned again by the next sync
+        changed = self.get_all_changes(watermark)[0]
+        self.assertEqual(changed, self.objs)
+
+    def test_invalid_since_and_cursor(self):
+        with self.assertRaises(ValidationError):
+            sync.get_changes(self.query, SyncModel.updated, 'yesterday', 10)
+        with self.assertRaises(ValidationError):
+            sync.get_changes(
+                self.query, SyncModel.updated, '0', 10, cursor='garbage'
+            )
+
+    def test_inequality_filter_on_other_property(self):
+        with self.assertRaises(ValidationError):
+            sync.get_changes(
+                self.query.filter(SyncModel.number > 1),
+                SyncModel.updated, '0', 10
+            )
+        with self.assertRaises(ValidationError):
+            sync.get_changes(
+                self.query.filter(SyncModel.number != 1),
+                SyncModel.updated, '0', 10
+            )
+        changes = sync.get_changes(
+            self.query.filter(SyncModel.number == 1),
+            SyncModel.updated, '0', 10
+        )
+        self.assertEqual(changes['changed'], [self.objs[1]])
+
+
+class SyncViewSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.app = webapp2.WSGIApplication([
+            route('/items', SyncViewSet),
+            route('/unsynced', UnsyncedViewSet)
+        ])
+        self.serializer = SyncSerializer()
+        self.objs = [
+            self.serializer.create({'number': number}) for number in range(4)
+        ]
+        self.serializer.delete(self.objs[0])
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def get(self, path):
+        return webapp2.Request.blank(path).get_response(self.app)
+
+    def test_sync_pages(self):
+        response = self.get('/items/?since=0')
+        self.assertEqual(response.status_int, 200)
+        first_page = json.loads(response.body)
+        self.assertEqual(
+            [obj['id'] for obj in first_page['results']],
+            [obj.key.id() for obj in self.objs[1:3]]
+        )
+        self.assertEqual(
+            first_page['results'][0]['updated'],
+            self.objs[1].updated.isoformat()
+        )
+        self.assertEqual(first_page['deleted'], [self.objs[0].key.id()])
+        self.assertIsNotNone(first_page['cursor'])
+
+        second_page = json.loads(self.get(
+            '/items/?since=0&cursor={cursor}'.format(
+                cursor=first_page['cursor']
+            )
+        ).body)
+        self.assertEqual(
+            [obj['id'] for obj in second_page['results']],
+            [self.objs[3].key.id()]
+        )
+        self.assertEqual(second_page['deleted'], [])
+        self.assertIsNone(second_page['cursor'])
+        self.assertEqual(second_page['watermark'], first_page['watermark'])
+
+        next_sync = json.loads(self.get(
+            '/items/?since={watermark}'.format(
+                watermark=first_page['watermark']
+            )
+        ).body)
+        self.assertEqual(next_sync['results'], [])
+        self.assertEqual(next_sync['deleted'], [])
+
+    def test_sync_with_filter(self):
+        self.assertEqual(
+            self.get('/items/?since=0&min_name=b').status_int, 400
+        )
+
+    def test_sync_not_supported(self):
+        self.assertEqual(self.get('/unsynced/?since=0').status_int, 400)
@@ -0,0 +1,217 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import json
+import threading
+import time
+import unittest
+
+import webapp2
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla.routers import batch, route
+from zennla.serializers import ModelSerializer
+from zennla.viewsets import BatchViewSet, ModelViewSet
+
+
+class BatchModel(ndb.Model):
+    name = ndb.StringProperty()
+
+
+class BatchSerializer(ModelSerializer):
+    model = BatchModel
+
+
+class BatchModelViewSet(ModelViewSet):
+    serializer_class = BatchSerializer
+
+
+class SlowHandler(webapp2.RequestHandler):
+    """
+    Records the largest number of requests it handled at the same time
+    """
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def get(self):
+        with SlowHandler.lock:
+            SlowHandler.active += 1
+            SlowHandler.max_active = max(
+                SlowHandler.max_active, SlowHandler.active
+            )
+        time.sleep(0.1)
+        with SlowHandler.lock:
+            SlowHandler.active -= 1
+        self.response.write(self.request.headers.get('X-Tag', ''))
+
+
+class SmallBatchViewSet(BatchViewSet):
+    max_batch_size = 2
+
+
+class CoalescedViewSet(ModelViewSet):
+    """
+    Counts the lists it computes, and keeps each in flight for a while
+    """
+    serializer_class = BatchSerializer
+    coalesce_reads = True
+    computations = 0
+
+    def list(self, *args, **kwargs):
+        CoalescedViewSet.computations += 1
+        time.sleep(0.2)
+        super(CoalescedViewSet, self).list(*args, **kwargs)
+        self.response.headers['X-Computation'] = str(
+            CoalescedViewSet.computations
+        )
+
+
+class BatchViewSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.app = webapp2.WSGIApplication([
+            route('/items', BatchModelViewSet),
+            webapp2.Route('/slow', SlowHandler),
+            batch('/batch'),
+            batch('/small-batch', SmallBatchViewSet)
+        ])
+        self.obj = BatchSerializer().create({'name': 'first'})
+        SlowHandler.max_active = 0
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def post(self, sub_requests, path='/batch'):
+        request = webapp2.Request.blank(
+            path, method='POST', body=json.dumps(sub_requests)
+        )
+        return request.get_response(self.app)
+
+    def test_gets_run_concurrently(self):
+        response = self.post([
+            {'path': '/slow', 'headers': {'X-Tag': str(index)}}
+            for index in range(4)
+        ])
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(
+            [sub_response['body'] for sub_response in json.loads(
+                response.body
+            )],
+            ['0', '1', '2', '3']
+        )
+        self.assertGreater(SlowHandler.max_active, 1)
+
+    def test_write_runs_in_order(self):
+        response = self.post([
+            {'path': '/items/'},
+            {'path': '/items/', 'method': 'post', 'body': {'name': 'second'}},
+            {'path': '/items/'}
+        ])
+        before, created, after = json.loads(response.body)
+        self.assertEqual([obj['name'] for obj in before['body']], ['first'])
+        self.assertEqual(created['body']['name'], 'second')
+        self.assertEqual(
+            sorted(obj['name'] for obj in after['body']),
+            ['first', 'second']
+        )
+
+    def test_status_per_sub_request(self):
+        response = self.post([
+            {'path': '/items/{id}'.format(id=self.obj.key.id())},
+            {'path': '/items/{id}'.format(id=self.obj.key.id() + 1)},
+            {'path': '/missing/'}
+        ])
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(
+            [sub_response['status'] for sub_response in json.loads(
+                response.body
+            )],
+            [200, 400, 404]
+        )
+
+    def test_nested_batch_is_rejected(self):
+        response = self.post([{'path': '/batch', 'method': 'POST'}])
+        self.assertEqual(response.status_int, 400)
+
+    def test_max_batch_size(self):
+        self.assertEqual(
+            self.post([{'path': '/items/'}] * 2, '/small-batch').status_int,
+            200
+        )
+        self.assertEqual(
+            self.post([{'path': '/items/'}] * 3, '/small-batch').status_int,
+            400
+        )
+
+    def test_invalid_sub_requests(self):
+        for sub_request in [
+            'not an object',
+            {'path': 'items/'},
+            {'path': '/items/', 'method': 1},
+            {'path': '/items/', 'method': 'OPTIONS'},
+            {'path': '/items/', 'headers': ['X-Tag']},
+            {'path': '/items/', 'headers': {'X-Tag': 1}},
+            {'path': '/items/', 'method': 'POST', 'body': 'name'}
+        ]:
+            self.assertEqual(self.post([sub_request]).status_int, 400)
+
+
+class CoalescedViewSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.app = webapp2.WSGIApplication([
+            route('/items', CoalescedViewSet)
+        ])
+        BatchSerializer().create({'name': 'first'})
+        CoalescedViewSet.computations = 0
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def get_concurrently(self, urls):
+        responses = [None] * len(urls)
+
+        def get(index):
+            responses[index] = webapp2.Request.blank(
+                urls[index]
+            ).get_response(self.app)
+        threads = [
+            threading.Thread(target=get, args=(index,))
+            for index in range(len(urls))
+        ]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_concurrent_gets_share_one_computation(self):
+        responses = self.get_concurrently(['/items/'] * 3)
+        self.assertEqual(CoalescedViewSet.computations, 1)
+        for response in responses:
+            self.assertEqual(response.status_int, 200)
+            self.assertEqual(response.headers['X-Computation'], '1')
+            self.assertEqual(response.body, responses[0].body)
+        self.assertEqual(
+            [obj['name'] for obj in json.loads(responses[0].body)], ['first']
+        )
+
+    def test_distinct_hosts_are_computed_separately(self):
+        self.get_concurrently([
+            'http://one.example.com/items/', 'http://two.example.com/items/'
+        ])
+        self.assertEqual(CoalescedViewSet.computations, 2)
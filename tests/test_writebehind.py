@@ -0,0 +1,203 @@
+import sys
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine')
+sys.path.insert(1, 'google-cloud-sdk/platform/google_appengine/lib/yaml/lib')
+import threading
+import time
+import unittest
+
+from google.appengine.api import background_thread
+from google.appengine.api import runtime
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from zennla import writebehind
+from zennla.exceptions import ImproperlyConfigured
+from zennla.writebehind import WriteBehindBuffer, additive
+
+
+class CounterModel(ndb.Model):
+    count = ndb.IntegerProperty(default=0)
+
+
+class WriteBehindBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+        self.buffers = []
+        self.buffer = self.create_buffer(max_pending=10, max_delay=0.05)
+        self.keys = [CounterModel().put() for _ in range(2)]
+
+    def tearDown(self):
+        for buffer in self.buffers:
+            buffer.stop()
+            if buffer in writebehind._buffers:
+                writebehind._buffers.remove(buffer)
+        self.testbed.deactivate()
+
+    def create_buffer(self, **kwargs):
+        buffer = WriteBehindBuffer(**kwargs)
+        self.buffers.append(buffer)
+        return buffer
+
+    def add(self, key, value, buffer=None):
+        (buffer or self.buffer).add(key, {'count': (additive, value)})
+
+    def test_get_applies_pending_updates(self):
+        self.buffer.max_delay = 60
+        self.add(self.keys[0], 2)
+        self.add(self.keys[0], 3)
+        self.assertEqual(self.buffer.get(self.keys[0]).count, 5)
+        self.assertEqual(self.keys[0].get(use_cache=False).count, 0)
+
+    def test_flushed_after_max_delay_without_further_use(self):
+        self.add(self.keys[0], 2)
+        time.sleep(0.5)
+        self.assertEqual(self.keys[0].get(use_cache=False).count, 2)
+
+    def test_flushed_at_max_pending(self):
+        self.buffer.max_delay = 60
+        self.buffer.max_pending = 2
+        self.add(self.keys[0], 1)
+        self.add(self.keys[1], 1)
+        self.assertEqual(
+            [key.get(use_cache=False).count for key in self.keys], [1, 1]
+        )
+
+    def test_get_only_waits_for_its_own_key(self):
+        self.buffer.max_delay = 60
+        writing = threading.Event()
+        resume = threading.Event()
+        write_updates = writebehind._write_updates
+
+        def slow_write_updates(keys, pending):
+            writing.set()
+            resume.wait(5)
+            write_updates(keys, pending)
+
+        writebehind._write_updates = slow_write_updates
+        try:
+            self.add(self.keys[0], 2)
+            flush = threading.Thread(target=self.buffer.flush)
+            flush.start()
+            writing.wait(5)
+            self.assertEqual(self.buffer.get(self.keys[1]).count, 0)
+
+            results = []
+            read = threading.Thread(
+                target=lambda: results.append(self.buffer.get(self.keys[0]))
+            )
+            read.start()
+            time.sleep(0.1)
+            self.assertEqual(results, [])
+            resume.set()
+            flush.join()
+            read.join()
+            self.assertEqual(results[0].count, 2)
+        finally:
+            writebehind._write_updates = write_updates
+
+    def test_failed_flush_is_retried(self):
+        self.buffer.max_delay = 60
+        write_updates = writebehind._write_updates
+
+        def failing_write_updates(keys, pending):
+            # Updates buffered during the failed flush are merged with
+            # the requeued ones
+            self.add(self.keys[0], 3)
+            raise RuntimeError()
+
+        writebehind._write_updates = failing_write_updates
+        try:
+            self.add(self.keys[0], 2)
+            self.assertRaises(RuntimeError, self.buffer.flush)
+        finally:
+            writebehind._write_updates = write_updates
+        self.assertEqual(self.buffer.get(self.keys[0]).count, 5)
+        self.assertEqual(self.keys[0].get(use_cache=False).count, 0)
+        self.buffer.flush()
+        self.assertEqual(self.keys[0].get(use_cache=False).count, 5)
+
+    def test_get_applies_updates_pending_in_other_instances(self):
+        self.buffer.max_delay = 60
+        other = self.create_buffer(max_delay=60)
+        self.add(self.keys[0], 2)
+        self.add(self.keys[0], 3, other)
+        self.assertEqual(self.buffer.get(self.keys[0]).count, 5)
+        self.assertEqual(other.get(self.keys[0]).count, 5)
+        self.assertEqual(self.buffer.get(self.keys[1]).count, 0)
+
+        other.flush()
+        self.assertEqual(self.keys[0].get(use_cache=False).count, 3)
+        self.assertEqual(self.buffer.get(self.keys[0]).count, 5)
+        self.assertEqual(other.get(self.keys[0]).count, 5)
+        self.buffer.flush()
+        self.assertEqual(other.get(self.keys[0]).count, 5)
+
+    def test_get_waits_for_flush_in_other_instances(self):
+        self.buffer.max_delay = 60
+        other = self.create_buffer(max_delay=60)
+        writing = threading.Event()
+        resume = threading.Event()
+        write_updates = writebehind._write_updates
+
+        def slow_write_updates(keys, pending):
+            writing.set()
+            resume.wait(5)
+            write_updates(keys, pending)
+
+        writebehind._write_updates = slow_write_updates
+        try:
+            self.add(self.keys[0], 2, other)
+            flush = threading.Thread(target=other.flush)
+            flush.start()
+            writing.wait(5)
+            results = []
+            read = threading.Thread(
+                target=lambda: results.append(self.buffer.get(self.keys[0]))
+            )
+            read.start()
+            time.sleep(0.1)
+            self.assertEqual(results, [])
+            resume.set()
+            flush.join()
+            read.join()
+            self.assertEqual(results[0].count, 2)
+        finally:
+            writebehind._write_updates = write_updates
+
+    def test_expired_updates_of_other_instances_are_ignored(self):
+        other = self.create_buffer(max_delay=60)
+        grace = writebehind.SHARED_GRACE
+        writebehind.SHARED_GRACE = -120
+        try:
+            self.add(self.keys[0], 2, other)
+        finally:
+            writebehind.SHARED_GRACE = grace
+        self.assertEqual(self.buffer.get(self.keys[0]).count, 0)
+
+    def test_refused_without_background_thread(self):
+        start = background_thread.start_new_background_thread
+
+        def unsupported(target, args):
+            raise background_thread.FrontendsNotSupported()
+
+        background_thread.start_new_background_thread = unsupported
+        try:
+            with self.assertRaises(ImproperlyConfigured):
+                self.add(self.keys[0], 2)
+        finally:
+            background_thread.start_new_background_thread = start
+        self.assertEqual(self.buffer.get(self.keys[0]).count, 0)
+        self.assertNotIn(self.buffer, writebehind._buffers)
+
+    def test_shutdown_hook_flushes(self):
+        self.buffer.max_delay = 60
+        self.add(self.keys[0], 2)
+        shutdown_hook = runtime.set_shutdown_hook(None)
+        runtime.set_shutdown_hook(shutdown_hook)
+        shutdown_hook()
+        self.assertEqual(self.keys[0].get(use_cache=False).count, 2)
@@ -0,0 +1,186 @@
+"""
+Admission controls limit the requests a viewset accepts, so that a burst
+of expensive requests is rejected quickly instead of piling up and slowing
+down every other request.
+Their state is shared by all the instances of the app through memcache,
+and kept by each instance when memcache is unavailable.
+"""
+import math
+import threading
+import time
+import uuid
+from google.appengine.api import memcache
+from zennla.exceptions import ServiceUnavailable, TooManyRequests
+
+
+class AdmissionControl(object):
+    """
+    The base class for all admission controls
+    Subclasses should override `.admit()`
+    """
+    key_prefix = 'zennla:admission:'
+
+    def admit(self, key):
+        """
+        Admit a request under `key` (identifying the viewset and action)
+        Return a callable to be called once the request is handled
+        Raise an APIException with a `retry_after` if it is over budget
+        """
+        raise NotImplementedError(
+            'Admission control requires .admit() to be implemented'
+        )
+
+
+class ConcurrencyLimit(AdmissionControl):
+    """
+    Limits the number of requests handled at the same time to `limit`
+    Rejected requests get a 503 with a Retry-After of `retry_after` seconds.
+    Each admitted request holds a lease on a slot until it is released or
+    for at most `lease_time` seconds, so that slots leaked by instances
+    which died mid-request are reclaimed. Requests which still conflict
+    with concurrent updates of the leases after `cas_retries` attempts are
+    rejected too.
+    """
+    cas_retries = 5
+
+    def __init__(self, limit, retry_after=1, lease_time=60):
+        self.limit = limit
+        self.retry_after = retry_after
+        self.lease_time = lease_time
+        self._lock = threading.Lock()
+        self._local_counts = {}
+
+    def _get_live_leases(self, leases, now):
+        return dict(
+            (lease, expires) for lease, expires in leases.iteritems()
+            if expires > now
+        )
+
+    def admit(self, key):
+        key = self.key_prefix + 'concurrency:' + key
+        lease = uuid.uuid4().hex
+        client = memcache.Client()
+        expiry = int(math.ceil(self.lease_time))
+        for _ in range(self.cas_retries):
+            now = time.time()
+            leases = client.gets(key)
+            if leases is None:
+                status = _get_set_status(client.add_multi_async(
+                    {key: {lease: now + self.lease_time}}, time=expiry
+                ), key)
+            else:
+                leases = self._get_live_leases(leases, now)
+                if len(leases) >= self.limit:
+                    self._reject()
+                leases[lease] = now + self.lease_time
+                status = _get_set_status(client.cas_multi_async(
+                    {key: leases}, time=expiry
+                ), key)
+            if status == memcache.STORED:
+                return lambda: self._release(key, lease)
+            if status is None:
+                return self._admit_locally(key)
+            # The leases were updated concurrently
+        self._reject()
+
+    def _release(self, key, lease):
+        client = memcache.Client()
+        for _ in range(self.cas_retries):
+            leases = client.gets(key)
+            if leases is None or lease not in leases:
+                return
+            leases = self._get_live_leases(leases, time.time())
+            leases.pop(lease, None)
+            if client.cas(key, leases, time=int(math.ceil(self.lease_time))):
+                return
+        # Otherwise the lease expires after `lease_time` seconds
+
+    def _admit_locally(self, key):
+        with self._lock:
+            if self._local_counts.get(key, 0) >= self.limit:
+                self._reject()
+            self._local_counts[key] = self._local_counts.get(key, 0) + 1
+
+        def release():
+            with self._lock:
+                self._local_counts[key] -= 1
+        return release
+
+    def _reject(self):
+        raise ServiceUnavailable(
+            "Too many concurrent requests. Try again later.",
+            retry_after=self.retry_after
+        )
+
+
+class TokenBucket(AdmissionControl):
+    """
+    Limits requests to `rate` per second on average, allowing bursts of
+    up to `burst` requests (default is `rate`)
+    Rejected requests get a 429 with a Retry-After of the time until a
+    token is available. Requests which still conflict with concurrent
+    updates of the bucket after `cas_retries` attempts are rejected too.
+    """
+    cas_retries = 5
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or rate
+        self._lock = threading.Lock()
+        self._local_buckets = {}
+
+    def _refill(self, tokens, timestamp, now):
+        return min(self.burst, tokens + (now - timestamp) * self.rate)
+
+    def _reject(self, tokens=0):
+        raise TooManyRequests(
+            "Request rate limit exceeded. Try again later.",
+            retry_after=(1 - tokens) / self.rate
+        )
+
+    def admit(self, key):
+        key = self.key_prefix + 'bucket:' + key
+        client = memcache.Client()
+        # Expire buckets once they would have refilled anyway
+        expiry = int(self.burst / self.rate) + 1
+        for _ in range(self.cas_retries):
+            now = time.time()
+            state = client.gets(key)
+            if state is None:
+                status = _get_set_status(client.add_multi_async(
+                    {key: (self.burst - 1, now)}, time=expiry
+                ), key)
+            else:
+                tokens = self._refill(state[0], state[1], now)
+                if tokens < 1:
+                    self._reject(tokens)
+                status = _get_set_status(client.cas_multi_async(
+                    {key: (tokens - 1, now)}, time=expiry
+                ), key)
+            if status == memcache.STORED:
+                return lambda: None
+            if status is None:
+                return self._admit_locally(key)
+            # The bucket was updated concurrently
+        self._reject()
+
+    def _admit_locally(self, key):
+        with self._lock:
+            now = time.time()
+            tokens, timestamp = self._local_buckets.get(key, (self.burst, now))
+            tokens = self._refill(tokens, timestamp, now)
+            if tokens < 1:
+                self._reject(tokens)
+            self._local_buckets[key] = (tokens - 1, now)
+        return lambda: None
+
+
+def _get_set_status(rpc, key):
+    """
+    Return the status of setting `key` with the memcache `rpc`, or None
+    if memcache is unavailable
+    """
+    statuses = rpc.get_result()
+    if not statuses or statuses.get(key) == memcache.ERROR:
+        return None
+    return statuses.get(key)
@@ -0,0 +1,87 @@
+"""
+Coalescing lets concurrent identical reads share a single computation.
+While a read is in flight, identical reads wait for it and share its
+result (or its error) instead of fetching, serializing and rendering
+the same data again.
+"""
+import sys
+import threading
+import urllib
+
+
+def get_request_key(request, vary_headers=('Accept',)):
+    """
+    Return a normalized key identifying `request` by its method, host, path,
+    sorted query parameters and the values of the `vary_headers`
+    """
+    query = urllib.urlencode(sorted(
+        (name.encode('utf-8'), value.encode('utf-8'))
+        for name, value in request.GET.items()
+    ))
+    headers = '|'.join(
+        request.headers.get(header, '').lower() for header in vary_headers
+    )
+    return '{method} {host}{path}?{query} {headers}'.format(
+        method=request.method,
+        host=request.host,
+        path=request.path,
+        query=query,
+        headers=headers
+    )
+
+
+class _Call(object):
+    """
+    A computation in flight
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def get(self):
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls sharing the same key
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        """
+        Call `func` and return its result, unless a call for `key` is
+        already in flight. In that case, wait for it (up to `timeout`
+        seconds) and return its result or raise its exception.
+        If the wait times out, call `func` independently.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            if call.event.wait(timeout):
+                return call.get()
+            return func()
+
+        try:
+            call.result = func()
+        except Exception:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+# Reads in flight, shared by all the viewsets of the instance
+read_flights = SingleFlight()
@@ -0,0 +1,47 @@
+"""
+Helpers for running work concurrently within a single request
+"""
+import sys
+import threading
+
+
+def map_concurrently(func, items, max_workers=8):
+    """
+    Return `[func(item) for item in items]`, evaluated using up to
+    `max_workers` threads. The results are returned in the order of `items`.
+    If any call raises, the first exception (in `items` order) is re-raised
+    after all the workers have finished.
+    """
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    lock = threading.Lock()
+    pending = iter(range(len(items)))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(pending, None)
+            if index is None:
+                return
+            try:
+                results[index] = func(items[index])
+            except Exception:
+                errors[index] = sys.exc_info()
+
+    threads = [
+        threading.Thread(target=worker)
+        for _ in range(min(max_workers, len(items)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for error in errors:
+        if error is not None:
+            raise error[0], error[1], error[2]
+    return results
@@ -52,3 +52,29 @@ class UnacceptableRequest(APIException):
     """
     status_code = http.HTTP_406_NOT_ACCEPTABLE
     default_detail = {'detail': "The request made could not be accepted"}
+
+
+class TooManyRequests(APIException):
+    """
+    Raised when a request is over the rate limit of the resource
+    `retry_after` is the number of seconds after which it can be retried
+    """
+    status_code = http.HTTP_429_TOO_MANY_REQUESTS
+    default_detail = {'detail': "Request was throttled"}
+
+    def __init__(self, detail=None, retry_after=None):
+        super(TooManyRequests, self).__init__(detail)
+        self.retry_after = retry_after
+
+
+class ServiceUnavailable(APIException):
+    """
+    Raised when a request cannot be handled due to the load on the resource
+    `retry_after` is the number of seconds after which it can be retried
+    """
+    status_code = http.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = {'detail': "Service temporarily unavailable"}
+
+    def __init__(self, detail=None, retry_after=None):
+        super(ServiceUnavailable, self).__init__(detail)
+        self.retry_after = retry_after
@@ -0,0 +1,269 @@
+"""
+Exports serialize every entity of a kind into a single document.
+The kind's key space is split into ranges (shards) which are exported in
+parallel, either by a local worker pool or by task queue tasks, using a
+`renderers.StreamingRenderer`. The progress of every shard is stored in
+the datastore so that an interrupted export resumes where it stopped.
+"""
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import deferred
+from google.appengine.ext import ndb
+from zennla import concurrency
+from zennla.exceptions import ImproperlyConfigured
+from zennla.renderers import JSONLinesRenderer, StreamingRenderer
+
+
+class ExportJob(ndb.Model):
+    """
+    An export of all the entities of `kind`
+    """
+    kind = ndb.StringProperty(required=True)
+    format = ndb.StringProperty(required=True)
+    fieldnames = ndb.StringProperty(repeated=True, indexed=False)
+    shard_count = ndb.IntegerProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+    def get_shard_keys(self):
+        """
+        Return the keys of the shards of the job in order
+        Shards are root entities so that they can be updated in parallel
+        """
+        return [
+            ndb.Key(ExportShard, '{job}-{index}'.format(
+                job=self.key.id(), index=index
+            ))
+            for index in range(self.shard_count)
+        ]
+
+
+class ExportShard(ndb.Model):
+    """
+    The export of the key range [`start_key`, `end_key`) of a job's kind
+    A missing bound means the range is open.
+    """
+    job = ndb.KeyProperty(kind=ExportJob, required=True)
+    start_key = ndb.KeyProperty(indexed=False)
+    end_key = ndb.KeyProperty(indexed=False)
+    cursor = ndb.StringProperty(indexed=False)
+    chunk_count = ndb.IntegerProperty(default=0, indexed=False)
+    exported = ndb.IntegerProperty(default=0, indexed=False)
+    done = ndb.BooleanProperty(default=False, indexed=False)
+
+
+class ExportChunk(ndb.Model):
+    """
+    A rendered batch of rows of a shard. Child of an `ExportShard`,
+    numbered from 1 in order.
+    """
+    output = ndb.BlobProperty(compressed=True)
+
+
+def split_key_ranges(model, shard_count, oversampling=32):
+    """
+    Return a list of `shard_count` (or fewer) contiguous key ranges
+    (`start_key`, `end_key`) covering all the entities of `model`.
+    Split points are chosen from the `__scatter__` sample of the kind,
+    or from all of its keys if the sample is too small.
+    """
+    kind = model._get_kind()
+    keys = ndb.Query(kind=kind).order(
+        ndb.GenericProperty('__scatter__')
+    ).fetch(shard_count * oversampling, keys_only=True)
+    if len(keys) < shard_count - 1:
+        keys = ndb.Query(kind=kind).fetch(keys_only=True)
+    keys.sort()
+    split_points = []
+    for index in range(1, shard_count):
+        if not keys:
+            break
+        key = keys[index * len(keys) // shard_count]
+        if not split_points or split_points[-1] < key:
+            split_points.append(key)
+    bounds = [None] + split_points + [None]
+    return zip(bounds[:-1], bounds[1:])
+
+
+class Exporter(object):
+    """
+    Exporter exports all the entities of a serializer's model
+    The attributes that can be set are:
+        - `serializer_class`: The serializers.ModelSerializer class
+                used to serialize the entities
+        - `renderer_class`: The renderers.StreamingRenderer class used to
+                render the rows (default is JSONLinesRenderer)
+        - `shard_count`: Number of key ranges the kind is split into
+        - `batch_size`: Number of entities serialized and stored per chunk
+    """
+    serializer_class = None
+    renderer_class = JSONLinesRenderer
+    shard_count = 8
+    batch_size = 500
+
+    def __init__(self, serializer_class=None, renderer_class=None,
+                 shard_count=None, batch_size=None):
+        self.serializer_class = serializer_class or self.serializer_class
+        self.renderer_class = renderer_class or self.renderer_class
+        self.shard_count = shard_count or self.shard_count
+        self.batch_size = batch_size or self.batch_size
+        if self.serializer_class is None:
+            raise ImproperlyConfigured(
+                "No serializer class associated with the exporter"
+            )
+        if not issubclass(self.renderer_class, StreamingRenderer):
+            raise ImproperlyConfigured(
+                "Exports require a `StreamingRenderer`. Found {renderer} "
+                "instead".format(renderer=self.renderer_class.__name__)
+            )
+
+    def start(self):
+        """
+        Split the model's key space and create the job and its shards
+        Return the `ExportJob`
+        """
+        serializer = self.serializer_class()
+        key_ranges = split_key_ranges(serializer.model, self.shard_count)
+        job = ExportJob(
+            kind=serializer.model._get_kind(),
+            format=self.renderer_class.format,
+            fieldnames=serializer.get_field_names(),
+            shard_count=len(key_ranges)
+        )
+        job.put()
+        ndb.put_multi([
+            ExportShard(
+                key=shard_key, job=job.key,
+                start_key=start_key, end_key=end_key
+            )
+            for shard_key, (start_key, end_key) in zip(
+                job.get_shard_keys(), key_ranges
+            )
+        ])
+        return job
+
+    def get_shards(self, job):
+        """
+        Return the shards of `job` in order
+        Shards are read from the datastore rather than the context cache,
+        since they are updated by other threads (each with its own
+        context) or by tasks
+        """
+        return ndb.get_multi(
+            job.get_shard_keys(), use_cache=False, use_memcache=False
+        )
+
+    def run(self, job, max_workers=None):
+        """
+        Export the unfinished shards of `job` using a local worker pool
+        Calling it again after an interruption resumes the export
+        """
+        pending = [shard.key for shard in self.get_shards(job)
+                   if not shard.done]
+        concurrency.map_concurrently(
+            self.run_shard, pending,
+            max_workers=max_workers or self.shard_count
+        )
+
+    def defer(self, job, queue='default'):
+        """
+        Export the unfinished shards of `job` in task queue tasks
+        Requires the `deferred` builtin to be enabled in app.yaml
+        """
+        for shard in self.get_shards(job):
+            if not shard.done:
+                deferred.defer(
+                    _run_shard_task, self.serializer_class,
+                    self.renderer_class, self.batch_size, shard.key,
+                    _queue=queue
+                )
+
+    def get_shard_query(self, shard):
+        """
+        Return the query over the key range of `shard`
+        """
+        model = self.serializer_class.model
+        query = model.query()
+        if shard.start_key is not None:
+            query = query.filter(model._key >= shard.start_key)
+        if shard.end_key is not None:
+            query = query.filter(model._key < shard.end_key)
+        return query.order(model._key)
+
+    def run_shard(self, shard_key):
+        """
+        Export the shard at `shard_key`, one chunk of `batch_size`
+        entities at a time, starting from where it last stopped
+        """
+        serializer = self.serializer_class()
+        renderer = self.renderer_class()
+        shard = shard_key.get()
+        fieldnames = shard.job.get().fieldnames
+        query = self.get_shard_query(shard)
+        while not shard.done:
+            objs, cursor, more = query.fetch_page(
+                self.batch_size,
+                start_cursor=Cursor(urlsafe=shard.cursor)
+                if shard.cursor else None
+            )
+            chunk = ExportChunk(
+                parent=shard.key, id=shard.chunk_count + 1,
+                output=renderer.render_rows(
+                    serializer.serialize(objs), fieldnames
+                )
+            )
+            shard.cursor = cursor.urlsafe() if cursor else None
+            shard.chunk_count += 1
+            shard.exported += len(objs)
+            shard.done = not more
+            ndb.transaction(
+                lambda: ndb.put_multi([chunk, shard])
+            )
+
+    def get_progress(self, job):
+        """
+        Return a dict with the progress of `job`
+        """
+        shards = self.get_shards(job)
+        return {
+            'shards': len(shards),
+            'done': sum(1 for shard in shards if shard.done),
+            'exported': sum(shard.exported for shard in shards),
+            'complete': all(shard.done for shard in shards)
+        }
+
+    def iter_output(self, job, batch_size=20):
+        """
+        Yield the rendered export of `job`, chunk by chunk
+        Chunks are fetched `batch_size` at a time
+        Raise ImproperlyConfigured if the job is not complete
+        """
+        shards = self.get_shards(job)
+        if not all(shard.done for shard in shards):
+            raise ImproperlyConfigured(
+                "Export {id} is not complete".format(id=job.key.id())
+            )
+        yield self.renderer_class().render_header(job.fieldnames)
+        for shard in shards:
+            for start in range(1, shard.chunk_count + 1, batch_size):
+                chunk_keys = [
+                    ndb.Key(ExportChunk, chunk_id, parent=shard.key)
+                    for chunk_id in range(
+                        start, min(start + batch_size, shard.chunk_count + 1)
+                    )
+                ]
+                for chunk in ndb.get_multi(
+                    chunk_keys, use_cache=False, use_memcache=False
+                ):
+                    yield chunk.output
+
+    def get_output(self, job):
+        """
+        Return the rendered export of `job`
+        """
+        return ''.join(self.iter_output(job))
+
+
+def _run_shard_task(serializer_class, renderer_class, batch_size, shard_key):
+    Exporter(
+        serializer_class=serializer_class, renderer_class=renderer_class,
+        batch_size=batch_size
+    ).run_shard(shard_key)
@@ -4,7 +4,8 @@ They perform querying against query parameters supplied in a request
 """
 
 import operator
-from google.appengine.ext.db import BadValueError
+from google.appengine.api.datastore_errors import BadValueError
+from google.appengine.ext import ndb
 from zennla.exceptions import ImproperlyConfigured, ValidationError
 
 
@@ -129,6 +130,43 @@ class StringFilter(FieldFilter):
             )
 
 
+class SearchFilter(FieldFilter):
+    """
+    Filter for prefix search on the index property maintained by a
+    serializer's `search_index` (a `search.SearchIndex`)
+    Matches the objects having a token starting with each term of the value
+    """
+    def __init__(self, field, index):
+        """
+        `field` is the repeated `StringProperty` storing the index and
+        `index` the serializer's `search.SearchIndex` building it (used to
+        tokenize the search terms the same way)
+        """
+        super(SearchFilter, self).__init__(field)
+        if field._code_name != index.index_field:
+            raise ImproperlyConfigured(
+                "SearchFilter on `{field}` does not match the index stored "
+                "in `{index_field}`".format(
+                    field=field._code_name, index_field=index.index_field
+                )
+            )
+        self.index = index
+
+    def get_filter(self, value):
+        """
+        Overridden to return an equality filter on the index property
+        for each of the search terms
+        """
+        terms = self.index.get_terms(value)
+        if not terms:
+            raise ValidationError(
+                "Search terms must be at least {length} characters "
+                "long".format(length=self.index.min_prefix_length)
+            )
+        filters = [self.field == term for term in terms]
+        return filters[0] if len(filters) == 1 else ndb.AND(*filters)
+
+
 class FilterSet(object):
     """
     A FilterSet is associated with a ViewSet. The FilterSet filters the query
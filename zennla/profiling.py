@@ -0,0 +1,191 @@
+"""
+Profiling measures the memory used by each stage of handling a sample of
+requests (e.g. fetch, serialize, render and write for a list) and
+aggregates the measurements per route, so that the cost of each stage can
+be compared in place.
+Memory and allocations are measured with `tracemalloc` when it is
+available (Python 2.7 needs the pytracemalloc backport). If the app
+already traces memory allocations, its tracing is left running, so the
+peak of a stage is only known when it exceeds the app's own peak.
+Without `tracemalloc`, the instance's memory usage reported by App Engine
+is used, which is much coarser and has no peak, and allocations are
+counted by the garbage collector.
+All of these are measured for the whole process: with `threadsafe: true`,
+the allocations of requests handled concurrently with a profiled one are
+counted in its stages. For per-route numbers free of this noise, profile
+an instance that handles one request at a time (e.g. a version with
+`threadsafe: false` or `max_concurrent_requests: 1`).
+"""
+import contextlib
+import gc
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+MEGABYTE = 1024 * 1024
+
+
+def _get_memory_usage():
+    from google.appengine.api import runtime
+    return int(runtime.memory_usage().current() * MEGABYTE)
+
+
+def _count_allocations():
+    """
+    Return the net number of objects allocated since the last full
+    collection, as counted by the garbage collector
+    A generation is collected once its count exceeds its threshold, so each
+    collection of the youngest generation stands for `threshold0 + 1`
+    allocations, and each collection of the middle one for `threshold1 + 2`
+    collections of the youngest
+    """
+    count0, count1, count2 = gc.get_count()
+    threshold0, threshold1, _ = gc.get_threshold()
+    return count0 + (threshold0 + 1) * (count1 + (threshold1 + 2) * count2)
+
+
+class Profiler(object):
+    """
+    Aggregates the measurements of the stages of the profiled requests
+    per route. Only one request is profiled at a time on an instance.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+        self._stats = {}
+
+    def start(self, route):
+        """
+        Return a `RequestProfile` for a request to `route`, or None if
+        another request is being profiled
+        """
+        if not self._profiling.acquire(False):
+            return None
+        return RequestProfile(self, route)
+
+    def finish(self, profile):
+        """
+        Record the measurements of the `profile` of a finished request
+        """
+        try:
+            with self._lock:
+                route_stats = self._stats.setdefault(
+                    profile.route, {'requests': 0, 'stages': {}}
+                )
+                route_stats['requests'] += 1
+                for stage, measurement in profile.measurements:
+                    stage_stats = route_stats['stages'].setdefault(
+                        stage, dict(
+                            (name, {'total': 0, 'max': None})
+                            for name in measurement
+                        )
+                    )
+                    for name, value in measurement.iteritems():
+                        stage_stats[name]['total'] += value
+                        stage_stats[name]['max'] = max(
+                            stage_stats[name]['max'], value
+                        )
+        finally:
+            self._profiling.release()
+
+    def get_stats(self):
+        """
+        Return a dict mapping the profiled routes to their number of
+        profiled requests and the mean and max of each measurement
+        (`peak_bytes`, `allocated_bytes`, `objects`, `seconds`) per stage
+        """
+        with self._lock:
+            return dict(
+                (route, {
+                    'requests': route_stats['requests'],
+                    'stages': dict(
+                        (stage, dict(
+                            (name, {
+                                'mean': value['total'] /
+                                float(route_stats['requests']),
+                                'max': value['max']
+                            })
+                            for name, value in stage_stats.iteritems()
+                        ))
+                        for stage, stage_stats in
+                        route_stats['stages'].iteritems()
+                    )
+                })
+                for route, route_stats in self._stats.iteritems()
+            )
+
+    def reset(self):
+        """
+        Discard all the measurements
+        """
+        with self._lock:
+            self._stats = {}
+
+
+class RequestProfile(object):
+    """
+    Measures the stages of a profiled request to `route`
+    """
+    def __init__(self, profiler, route):
+        self.profiler = profiler
+        self.route = route
+        self.measurements = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Measure the code run in the context as the stage `name`
+        The measurements include the other threads of the process
+        """
+        traced = tracemalloc is not None and tracemalloc.is_tracing()
+        if traced:
+            memory_before, peak_before = tracemalloc.get_traced_memory()
+        elif tracemalloc is not None:
+            # Only the stage is traced, so the peak and the traces are its
+            # own
+            tracemalloc.start()
+        else:
+            memory_before = _get_memory_usage()
+        allocations_before = _count_allocations()
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            if tracemalloc is not None and not traced:
+                statistics = tracemalloc.take_snapshot().statistics(
+                    'filename'
+                )
+                allocated, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                objects = sum(statistic.count for statistic in statistics)
+            else:
+                objects = _count_allocations() - allocations_before
+                if traced:
+                    memory, peak = tracemalloc.get_traced_memory()
+                    allocated = memory - memory_before
+                    peak = peak - memory_before if peak > peak_before \
+                        else max(allocated, 0)
+                else:
+                    allocated = _get_memory_usage() - memory_before
+                    peak = max(allocated, 0)
+            self.measurements.append((name, {
+                'peak_bytes': peak,
+                'allocated_bytes': allocated,
+                'objects': objects,
+                'seconds': seconds
+            }))
+
+    def finish(self):
+        """
+        Record the measurements of the request
+        """
+        self.profiler.finish(self)
+
+
+# Measurements of the instance
+profiler = Profiler()
@@ -0,0 +1,110 @@
+"""
+The query cache stores the ordered keys matched by a list query in
+memcache, and fetches the entities with `ndb.get_multi`, which is served
+from ndb's own per-entity cache. Updating an entity therefore only
+invalidates that entity, unless it changes a property which cached
+queries filter or order on. That update, like inserting or deleting an
+entity, starts a new generation of cached key lists for its kind.
+"""
+import hashlib
+import time
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+KEY_PREFIX = 'zennla:query:'
+
+
+def _get_generation_key(kind):
+    return KEY_PREFIX + 'generation:' + kind
+
+
+def get_generation(kind):
+    """
+    Return the current generation of the cached queries on `kind`
+    (None if memcache is unavailable)
+    """
+    key = _get_generation_key(kind)
+    generation = memcache.get(key)
+    if generation is None:
+        # Start from the current time, so that key lists cached before the
+        # generation was evicted are not reused
+        memcache.add(key, int(time.time() * 1000))
+        generation = memcache.get(key)
+    return generation
+
+
+def bump_generation(kind):
+    """
+    Invalidate the cached queries on `kind`
+    Called when an entity of `kind` is inserted or deleted
+    """
+    memcache.incr(_get_generation_key(kind))
+
+
+def _get_property_key(kind, name):
+    return KEY_PREFIX + 'property:' + kind + ':' + name
+
+
+def get_query_properties(query):
+    """
+    Return the names of the properties `query` filters or orders on
+    (the top-level property of structured properties)
+    """
+    names = set()
+    nodes = [query.filters] if query.filters is not None else []
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ndb.ConjunctionNode, ndb.DisjunctionNode)):
+            nodes.extend(node)
+        elif isinstance(node, ndb.FilterNode):
+            names.add(node.__getnewargs__()[0])
+    if query.orders is not None:
+        names.update(query.orders._get_prop_names())
+    return set(name.split('.')[0] for name in names)
+
+
+def invalidate_properties(kind, names):
+    """
+    Invalidate the cached queries on `kind` if some of them filter or
+    order on any of the property `names`
+    Called when entities of `kind` are updated
+    """
+    if names and memcache.get_multi(
+        [_get_property_key(kind, name) for name in set(names)]
+    ):
+        bump_generation(kind)
+
+
+def get_cache_key(query, generation):
+    """
+    Return the memcache key of the keys matched by `query`
+    The query's representation includes its kind, filters and orders
+    """
+    return KEY_PREFIX + hashlib.sha1(
+        '{generation}:{query!r}'.format(generation=generation, query=query)
+    ).hexdigest()
+
+
+def fetch(query, timeout=300):
+    """
+    Return the entities matched by `query`, using the cached list of
+    their keys if there is one, or caching it for `timeout` seconds
+    """
+    generation = get_generation(query.kind)
+    cache_key = get_cache_key(query, generation)
+    keys = memcache.get(cache_key) if generation is not None else None
+    if keys is None:
+        if generation is not None:
+            # Record the properties the query depends on before running
+            # it, so that an update written before this record is seen by
+            # the query, and one written after it starts a new generation.
+            # The records do not expire, as cached lists of any timeout
+            # may depend on them.
+            memcache.set_multi(dict(
+                (_get_property_key(query.kind, name), 1)
+                for name in get_query_properties(query)
+            ))
+        keys = query.fetch(keys_only=True)
+        if generation is not None:
+            memcache.set(cache_key, keys, time=timeout)
+    return [obj for obj in ndb.get_multi(keys) if obj is not None]
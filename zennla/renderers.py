@@ -2,9 +2,24 @@
 Renderers are used to serialize a response into specific media types.
 They give us a generic way of being able to handle various media types
 on the response, such as JSON encoded data or HTML output.
+Dependencies used by a single renderer are imported by its `.load()`
+on first use, so that they are only loaded by the apps that need them.
 """
+import datetime
 import json
-from xml.etree import ElementTree
+from zennla.exceptions import ImproperlyConfigured
+
+
+def _to_json_compatible(value):
+    """
+    Return dates and times as ISO 8601 strings (used as the `default`
+    of json.dumps)
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(
+        "{value!r} is not JSON serializable".format(value=value)
+    )
 
 
 class BaseRenderer(object):
@@ -15,6 +30,14 @@ class BaseRenderer(object):
     media_type = None
     format = None
 
+    @classmethod
+    def load(cls):
+        """
+        Import and return any module the renderer depends on
+        Called on first use, or ahead of it by `ModelViewSet.warmup()`
+        """
+        return None
+
     def render(self, data):
         raise NotImplementedError(
             'Renderer class requires .render() to be implemented'
@@ -31,7 +54,7 @@ class JSONRenderer(BaseRenderer):
     def render(self, data):
         if data is None:
             return bytes()
-        return json.dumps(data)
+        return json.dumps(data, default=_to_json_compatible)
 
 
 class XMLRenderer(BaseRenderer):
@@ -41,12 +64,17 @@ class XMLRenderer(BaseRenderer):
     media_type = 'application/xml'
     format = 'xml'
 
+    @classmethod
+    def load(cls):
+        from xml.etree import ElementTree
+        return ElementTree
+
     def _data_to_xml(self, data, tag=None):
         """
         Convert the input data to XML
         """
         tag = tag or 'response'
-        elem = ElementTree.Element(tag)
+        elem = self.load().Element(tag)
         if isinstance(data, (list, tuple)):
             for item in data:
                 elem.append(self._dict_to_xml(item, tag=tag or 'list'))
@@ -60,4 +88,116 @@ class XMLRenderer(BaseRenderer):
     def render(self, data, tag=None):
         if data is None:
             return bytes()
-        return ElementTree.tostring(self._data_to_xml(data, tag))
+        return self.load().tostring(self._data_to_xml(data, tag))
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Base class for renderers whose output for a list of rows can be produced
+    in chunks and concatenated: a header followed by any number of chunks
+    of rows. Subclasses override `.render_rows()` and optionally
+    `.render_header()`.
+    """
+    def get_fieldnames(self, rows):
+        """
+        Return the sorted names of all the fields found in `rows`
+        """
+        return sorted(set(key for row in rows for key in row))
+
+    def render_header(self, fieldnames):
+        """
+        Render the header preceding all the rows
+        """
+        return bytes()
+
+    def render_rows(self, rows, fieldnames):
+        raise NotImplementedError(
+            'Renderer class requires .render_rows() to be implemented'
+        )
+
+    def render(self, data):
+        if data is None:
+            return bytes()
+        rows = data if isinstance(data, (list, tuple)) else [data]
+        fieldnames = self.get_fieldnames(rows)
+        return self.render_header(fieldnames) + self.render_rows(
+            rows, fieldnames
+        )
+
+
+class JSONLinesRenderer(StreamingRenderer):
+    """
+    Renderer which serializes to JSON, one object per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+
+    def render_rows(self, rows, fieldnames):
+        return ''.join(
+            json.dumps(row, default=_to_json_compatible) + '\n'
+            for row in rows
+        )
+
+
+class CSVRenderer(StreamingRenderer):
+    """
+    Renderer which serializes to CSV, with a header row of field names
+    Nested values are written as JSON
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    @classmethod
+    def load(cls):
+        import csv
+        return csv
+
+    def _to_cell(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, tuple, dict)):
+            return json.dumps(value, default=_to_json_compatible)
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return str(value)
+
+    def _write_rows(self, rows):
+        from cStringIO import StringIO
+        output = StringIO()
+        writer = self.load().writer(output)
+        for row in rows:
+            writer.writerow([self._to_cell(value) for value in row])
+        return output.getvalue()
+
+    def render_header(self, fieldnames):
+        return self._write_rows([fieldnames])
+
+    def render_rows(self, rows, fieldnames):
+        return self._write_rows(
+            [row.get(name) for name in fieldnames] for row in rows
+        )
+
+
+class MessagePackRenderer(StreamingRenderer):
+    """
+    Renderer which serializes to a stream of MessagePack objects
+    Requires the `msgpack` package
+    """
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+
+    @classmethod
+    def load(cls):
+        try:
+            import msgpack
+        except ImportError:
+            raise ImproperlyConfigured(
+                "MessagePackRenderer requires the `msgpack` package"
+            )
+        return msgpack
+
+    def render_rows(self, rows, fieldnames):
+        packb = self.load().packb
+        return ''.join(
+            packb(row, default=_to_json_compatible) for row in rows
+        )
@@ -1,9 +1,14 @@
 """
 Contains shortcut functions to map a resource to URLs
 """
+import urllib
+import urlparse
 import webapp2
+from webob import exc
 from webapp2_extras import routes
 import http
+from zennla.exceptions import ImproperlyConfigured
+from zennla.viewsets import BatchViewSet, ProfilingHandler, WarmupHandler
 
 
 def route(base_url, viewset, detail_field='id',
@@ -43,3 +48,258 @@ def route(base_url, viewset, detail_field='id',
             methods=allowed_detail_methods or [http.GET, http.PUT, http.DELETE]
         )
     ])
+
+
+def batch(url, viewset=None):
+    """
+    Return a webapp2.Route mapping `url` to a batch endpoint
+    The endpoint accepts a JSON list of sub-requests on POST and dispatches
+    each of them through the same application (See: viewsets.BatchViewSet)
+
+    Optional Parameters:
+        - `viewset`: The handler for the batch requests.
+                Default is `viewsets.BatchViewSet`
+    """
+    return webapp2.Route(
+        url,
+        handler=viewset or BatchViewSet,
+        name='{resource}-batch'.format(resource=url),
+        methods=[http.POST]
+    )
+
+
+def warmup(url='/_ah/warmup'):
+    """
+    Return a webapp2.Route handling App Engine warmup requests at `url`
+    Warmup requests require `warmup` in the `inbound_services` of app.yaml
+    (See: viewsets.WarmupHandler)
+    """
+    return webapp2.Route(url, handler=WarmupHandler, name='warmup')
+
+
+def profiling(url='/_zennla/profiling'):
+    """
+    Return a webapp2.Route exposing the profiling measurements of the
+    instance to admins at `url` (See: viewsets.ProfilingHandler)
+    """
+    return webapp2.Route(
+        url, handler=ProfilingHandler, name='profiling',
+        methods=[http.GET, http.DELETE]
+    )
+
+
+def to_int(segment):
+    """
+    Path segment -> int
+    """
+    if not segment.isdigit():
+        raise ValueError(segment)
+    return int(segment)
+
+
+def to_string(segment):
+    """
+    Path segment -> unicode
+    """
+    return segment.decode('utf-8')
+
+
+def to_key(segment):
+    """
+    Path segment (urlsafe key) -> ndb.Key
+    """
+    from google.appengine.ext import ndb
+    try:
+        return ndb.Key(urlsafe=segment)
+    except Exception:
+        raise ValueError(segment)
+
+
+# Converters of the detail path segment to the value passed to the viewset
+CONVERTERS = {
+    'int': to_int,
+    'string': to_string,
+    'key': to_key
+}
+
+
+class ResourceEndpoint(webapp2.BaseRoute):
+    """
+    The list or detail endpoint of a resource registered in a TrieRouter
+    Returned as the matched route of a request
+    """
+    def __init__(self, base_url, handler, name, methods, detail_field=None):
+        template = base_url + '/'
+        if detail_field is not None:
+            template += '<{field}>'.format(field=detail_field)
+        super(ResourceEndpoint, self).__init__(
+            template, handler=handler, name=name
+        )
+        self.base_url = base_url
+        self.methods = methods
+        self.detail_field = detail_field
+
+    def build(self, request, args, kwargs):
+        """
+        Return a URI for the endpoint. Keyword arguments other than the
+        detail field are added as query parameters. Accepts the `_full`,
+        `_scheme`, `_netloc` and `_fragment` arguments of webapp2.Route
+        """
+        kwargs = dict(kwargs)
+        full = kwargs.pop('_full', False)
+        scheme = kwargs.pop('_scheme', None)
+        netloc = kwargs.pop('_netloc', None)
+        fragment = kwargs.pop('_fragment', None) or ''
+        path = self.base_url + '/'
+        if self.detail_field is not None:
+            value = kwargs.pop(self.detail_field)
+            if hasattr(value, 'urlsafe'):
+                value = value.urlsafe()
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            path += urllib.quote(str(value), safe='')
+        query = urllib.urlencode(sorted(
+            (name, value.encode('utf-8') if isinstance(value, unicode)
+                else value)
+            for name, value in kwargs.iteritems()
+        ))
+        if full or scheme or netloc:
+            scheme = scheme or request.scheme
+            netloc = netloc or request.host
+        return urlparse.urlunsplit(
+            (scheme or '', netloc or '', path, query, fragment)
+        )
+
+
+class _TrieNode(object):
+    """
+    A path segment of a TrieRouter
+    """
+    def __init__(self):
+        self.children = {}  # Static path segment -> _TrieNode
+        self.param = None  # _TrieNode matching any convertible segment
+        self.param_name = None
+        self.converter = None
+        self.endpoint = None
+
+
+class TrieRouter(webapp2.BaseRoute):
+    """
+    A single webapp2 route for any number of resources, looked up in a
+    trie of path segments. Finding the viewset for a request takes time
+    proportional to the length of its path, however many resources are
+    registered.
+
+    Resources are registered with `register()` and the router is added to
+    the application like any other route:
+
+        router = TrieRouter()
+        router.register('/pokemon', PokemonViewSet)
+        router.register('/trainers', TrainerViewSet, detail_type='key')
+        app = webapp2.WSGIApplication([router])
+    """
+    def __init__(self):
+        super(TrieRouter, self).__init__(None)
+        self._root = _TrieNode()
+        self._endpoints = []
+
+    def register(self, base_url, viewset, detail_field='id',
+                 detail_type='int', allowed_list_methods=None,
+                 allowed_detail_methods=None):
+        """
+        Register the list view of `viewset` at `base_url`/ (named
+        `base_url`-list) and its detail view at `base_url`/<id> (named
+        `base_url`-detail), like `route()`
+
+        Optional Parameters:
+            - `detail_field`: The name of the field used to identify
+                    a resource
+            - `detail_type`: The type the detail path segment is converted
+                    to before being passed to the viewset. One of `int`,
+                    `string` or `key` (a urlsafe ndb key). Default is `int`
+            - `allowed_list_methods`: List of HTTP methods allowed for
+                    list view. Default is [GET, POST]
+            - `allowed_detail_methods`: List of HTTP methods allowed for
+                    detail view. Default is [GET, PUT, DELETE]
+        """
+        if detail_type not in CONVERTERS:
+            raise ImproperlyConfigured(
+                "`detail_type` must be one of: {types}. Found {type} "
+                "instead.".format(
+                    types=', '.join(sorted(CONVERTERS)), type=detail_type
+                )
+            )
+        base_url = '/' + '/'.join(self._split(base_url))
+        node = self._root
+        for segment in self._split(base_url):
+            node = node.children.setdefault(segment, _TrieNode())
+        if node.endpoint is not None:
+            raise ImproperlyConfigured(
+                "{url} is already registered".format(url=base_url)
+            )
+        node.param = _TrieNode()
+        node.param_name = detail_field
+        node.converter = CONVERTERS[detail_type]
+        node.endpoint = ResourceEndpoint(
+            base_url, viewset, '{resource}-list'.format(resource=base_url),
+            allowed_list_methods or [http.GET, http.POST]
+        )
+        node.param.endpoint = ResourceEndpoint(
+            base_url, viewset,
+            '{resource}-detail'.format(resource=base_url),
+            allowed_detail_methods or [http.GET, http.PUT, http.DELETE],
+            detail_field=detail_field
+        )
+        self._endpoints.extend([node.endpoint, node.param.endpoint])
+
+    def _split(self, path):
+        return [segment for segment in path.split('/') if segment]
+
+    def _lookup(self, node, segments, index, kwargs):
+        """
+        Return the endpoint matching `segments` from `index` onwards under
+        `node`, and the converted values of its path parameters
+        Static segments take precedence over path parameters
+        """
+        if index == len(segments):
+            if node.endpoint is None:
+                return None
+            return node.endpoint, kwargs
+        segment = segments[index]
+        if segment in node.children:
+            match = self._lookup(
+                node.children[segment], segments, index + 1, kwargs
+            )
+            if match is not None:
+                return match
+        if node.param is not None:
+            try:
+                value = node.converter(urllib.unquote(segment))
+            except ValueError:
+                return None
+            kwargs = dict(kwargs)
+            kwargs[node.param_name] = value
+            return self._lookup(node.param, segments, index + 1, kwargs)
+        return None
+
+    def match(self, request):
+        """
+        Return (endpoint, args, kwargs) for the `request`, None if no
+        resource matches its path
+        Raise exc.HTTPMethodNotAllowed if the method is not allowed
+        """
+        match = self._lookup(self._root, self._split(request.path), 0, {})
+        if match is None:
+            return None
+        endpoint, kwargs = match
+        if request.method not in endpoint.methods:
+            raise exc.HTTPMethodNotAllowed()
+        return endpoint, (), kwargs
+
+    def get_routes(self):
+        for endpoint in self._endpoints:
+            yield endpoint
+
+    def get_build_routes(self):
+        for endpoint in self._endpoints:
+            yield endpoint.name, endpoint
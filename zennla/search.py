@@ -0,0 +1,91 @@
+"""
+Search indexes make prefix search on text fields a single index lookup.
+A serializer with a `search_index` stores the normalized tokens of the
+indexed fields, and all their prefixes, in a repeated `StringProperty`
+of the model. A `filters.SearchFilter` then turns each search term into
+an equality filter on that property.
+"""
+import re
+import unicodedata
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """
+    Return `text` in lower case, without accents
+    """
+    if not isinstance(text, unicode):
+        text = str(text).decode('utf-8')
+    return u''.join(
+        char for char in unicodedata.normalize('NFKD', text.lower())
+        if not unicodedata.combining(char)
+    )
+
+
+def tokenize(text):
+    """
+    Split `text` into a list of normalized words
+    """
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+class SearchIndex(object):
+    """
+    Describes the search index of a model:
+        - `fields`: Names of the fields whose values are indexed
+        - `index_field`: Name of the repeated `StringProperty` of the model
+                storing the index (default is `search_index`)
+        - `min_prefix_length`: Length of the shortest prefixes indexed
+        - `max_prefix_length`: Length of the longest prefixes indexed.
+                Longer search terms are truncated to it
+        - `tokenizer`: Function splitting a field value into normalized
+                tokens (default is `tokenize`)
+    """
+    def __init__(self, fields, index_field='search_index',
+                 min_prefix_length=1, max_prefix_length=10,
+                 tokenizer=tokenize):
+        self.fields = fields
+        self.index_field = index_field
+        self.min_prefix_length = min_prefix_length
+        self.max_prefix_length = max_prefix_length
+        self.tokenizer = tokenizer
+
+    def get_prefixes(self, token):
+        """
+        Return the indexed prefixes of `token`
+        """
+        return [
+            token[:length] for length in range(
+                self.min_prefix_length,
+                min(len(token), self.max_prefix_length) + 1
+            )
+        ]
+
+    def build(self, obj):
+        """
+        Return the sorted index terms of the model object `obj`
+        """
+        terms = set()
+        for field in self.fields:
+            values = getattr(obj, field)
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for value in values:
+                if value is None:
+                    continue
+                for token in self.tokenizer(value):
+                    terms.update(self.get_prefixes(token))
+        return sorted(terms)
+
+    def get_terms(self, query):
+        """
+        Return the index terms that an object must have to match the
+        search `query`: its tokens, truncated to `max_prefix_length`.
+        Tokens shorter than `min_prefix_length` are ignored.
+        """
+        return sorted(set(
+            token[:self.max_prefix_length]
+            for token in self.tokenizer(query)
+            if len(token) >= self.min_prefix_length
+        ))
@@ -6,7 +6,7 @@ Serializers have a two-fold purpose:
         and create/update an object
 """
 from google.appengine.ext import ndb
-from google.appengine.ext.db import BadValueError
+from google.appengine.api.datastore_errors import BadValueError
 from zennla.exceptions import NonSerializableException, ValidationError
 
 
@@ -22,10 +22,24 @@ class ModelSerializer(object):
                 during serialization. Takes precedence over `include_fields`
         - `translate_fields`: A dict mapping field names to the names used in
                 serialized representation
+        - `sync_field`: Name of an auto-updated `DateTimeProperty`
+                (`auto_now=True`) of the model. Enables delta sync and
+                makes `delete()` record tombstones
+        - `write_behind`: A `writebehind.WriteBehindBuffer`. If set, updates
+                to existing objects are buffered and written in batches
+        - `merge_fields`: A dict mapping field names to the merge functions
+                used to combine buffered updates (default is
+                `writebehind.last_write_wins`)
+        - `search_index`: A `search.SearchIndex`. If set, its index property
+                is updated on save and left out of the serialized form
     """
     include_fields = None
     exclude_fields = None
     translate_fields = {}
+    sync_field = None
+    write_behind = None
+    merge_fields = {}
+    search_index = None
     model = None
 
     def _save(self, data, instance):
@@ -34,10 +48,64 @@ class ModelSerializer(object):
         Return the updated `instance`
         """
         validated_data = self._validate(data)
+        if self.write_behind is not None and instance.key is not None:
+            return self._save_behind(data, validated_data, instance)
+        previous = instance.to_dict() if instance.key is not None else None
         instance.populate(**validated_data)
         if hasattr(self, 'pre_save'):
             self.pre_save(instance, data, validated_data)
+        if self.search_index is not None:
+            setattr(
+                instance, self.search_index.index_field,
+                self.search_index.build(instance)
+            )
         instance.put()
+        if previous is not None:
+            self._invalidate_queries(instance, previous)
+        if hasattr(self, 'post_save'):
+            self.post_save(instance, data, validated_data)
+        return instance
+
+    def _invalidate_queries(self, instance, previous):
+        """
+        Invalidate the cached queries depending on the properties of the
+        updated `instance` which changed from their `previous` values
+        """
+        from zennla import querycache
+        current = instance.to_dict()
+        querycache.invalidate_properties(instance.key.kind(), [
+            prop._name for prop in instance._properties.itervalues()
+            if current.get(prop._code_name) !=
+            previous.get(prop._code_name)
+        ])
+
+    def _save_behind(self, data, validated_data, instance):
+        """
+        Buffer the fields present in `data` as updates to the existing
+        `instance` in `write_behind`
+        Return the `instance` with the updates merged in
+        """
+        from zennla import writebehind
+        updates = dict(
+            (name, (
+                self.merge_fields.get(name, writebehind.last_write_wins),
+                value
+            ))
+            for name, value in validated_data.iteritems()
+            if name in data or self.translate_fields.get(name) in data
+        )
+        writebehind.apply_updates(instance, updates)
+        if hasattr(self, 'pre_save'):
+            self.pre_save(instance, data, validated_data)
+        if self.search_index is not None and any(
+            name in updates for name in self.search_index.fields
+        ):
+            terms = self.search_index.build(instance)
+            setattr(instance, self.search_index.index_field, terms)
+            updates[self.search_index.index_field] = (
+                writebehind.last_write_wins, terms
+            )
+        self.write_behind.add(instance.key, updates)
         if hasattr(self, 'post_save'):
             self.post_save(instance, data, validated_data)
         return instance
@@ -103,12 +171,45 @@ class ModelSerializer(object):
         Create a model instance with the given data
         Optionally take a `model` argument (default is self.model)
         """
-        return self._save(data=data, instance=self.get_obj(model=model))
+        from zennla import querycache
+        obj = self._save(data=data, instance=self.get_obj(model=model))
+        querycache.bump_generation(obj.key.kind())
+        return obj
+
+    def delete(self, obj):
+        """
+        Delete the model object `obj`
+        Record a tombstone for it if `sync_field` is set
+        """
+        from zennla import querycache
+        if self.sync_field is not None:
+            from zennla import sync
+            sync.write_tombstone(obj.key)
+        obj.key.delete()
+        querycache.bump_generation(obj.key.kind())
+
+    def get_field_names(self, model=None):
+        """
+        Return the sorted names of the fields in the serialized
+        representation of the `model` (default is self.model)
+        """
+        model = model or self.model
+        names = [prop._code_name for prop in model._properties.itervalues()]
+        if self.include_fields is not None:
+            names = [name for name in names if name in self.include_fields]
+        names = [
+            name for name in names if name not in self.get_exclude_fields()
+        ]
+        names = [self.translate_fields.get(name, name) for name in names]
+        return sorted(names + ['id'])
 
     def get_obj(self, id=None, model=None):
         """
         Return an instance at `id` of the given `model`
         (or of self.model if model isn't specified)
+        `id` can also be an ndb.Key of the `model`. A `str` id made of
+        digits (as captured by `routers.route()`) is converted to an int,
+        while unicode ids (as converted by a `TrieRouter`) are used as is
         Return a new instance if `id` isn't specified
         """
         model = model or self.model
@@ -118,11 +219,16 @@ class ModelSerializer(object):
                     type=type(model).__name__
                 )
             )
-        try:
+        if isinstance(id, str) and id.isdigit():
             id = int(id)
-        except (TypeError, ValueError):
-            pass
-        obj = model() if id is None else model.get_by_id(id)
+        if id is None:
+            obj = model()
+        elif isinstance(id, ndb.Key) and id.kind() != model._get_kind():
+            obj = None
+        else:
+            key = id if isinstance(id, ndb.Key) else ndb.Key(model, id)
+            obj = key.get() if self.write_behind is None \
+                else self.write_behind.get(key)
         if id is not None and obj is None:
             raise ValidationError(
                 "Object with id {id} not found".format(id=id)
@@ -132,12 +238,14 @@ class ModelSerializer(object):
     def serialize(self, serializable):
         """
         Return a serialized representation of `serializable`
-        `serializable` is either a queryset or a model object
+        `serializable` is either a queryset, a list of model objects
+        or a model object
         """
         if isinstance(serializable, ndb.Model):
             return self.to_dict_repr(serializable)
-        elif isinstance(serializable, ndb.Query):
-            serializable = serializable.fetch()
+        elif isinstance(serializable, (ndb.Query, list, tuple)):
+            if isinstance(serializable, ndb.Query):
+                serializable = serializable.fetch()
             return [
                 self.to_dict_repr(obj) for obj in serializable
             ]
@@ -147,6 +255,16 @@ class ModelSerializer(object):
             )
         )
 
+    def get_exclude_fields(self):
+        """
+        Return the names of the fields left out of the serialized form:
+        `exclude_fields` and the index property of `search_index`
+        """
+        exclude_fields = list(self.exclude_fields or [])
+        if self.search_index is not None:
+            exclude_fields.append(self.search_index.index_field)
+        return exclude_fields
+
     def to_dict_repr(self, obj):
         """
         Model `Obj` -> dict representation
@@ -154,7 +272,7 @@ class ModelSerializer(object):
         """
         dct = obj.to_dict(
             include=self.include_fields,
-            exclude=self.exclude_fields
+            exclude=self.get_exclude_fields()
         )
         dct['id'] = obj.key.id()
         for key, value in self.translate_fields.iteritems():
@@ -0,0 +1,162 @@
+"""
+Delta sync lets clients fetch only the entities that changed since they
+last synced, instead of re-downloading a whole collection.
+A sync is identified by a watermark: the time at which it started, minus
+a safety lag. Changes stamped shortly before a sync (by the clock of
+another instance) may not be visible to its queries yet; they are picked up
+by the next sync instead, since it starts from a time before them. Entities
+changed within the lag are therefore returned by two consecutive syncs.
+Deletions are recorded as `Tombstone` entities so they can be synced too.
+"""
+import base64
+import calendar
+import datetime
+import json
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+from zennla.exceptions import ValidationError
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Seconds subtracted from the start of a sync to compute its watermark
+DEFAULT_LAG = 30
+
+INEQUALITY_OPERATORS = ('<', '<=', '>', '>=', '!=')
+
+
+class Tombstone(ndb.Model):
+    """
+    Records the deletion of an entity of `kind` with id `entity_id`
+    Querying tombstones requires a composite index on (`kind`, `deleted`)
+    """
+    kind = ndb.StringProperty(required=True)
+    entity_id = ndb.GenericProperty(indexed=False)
+    deleted = ndb.DateTimeProperty(auto_now=True)
+
+
+def write_tombstone(key):
+    """
+    Record the deletion of the entity at `key`
+    """
+    return Tombstone(kind=key.kind(), entity_id=key.id()).put()
+
+
+def to_watermark(timestamp):
+    """
+    datetime `timestamp` -> watermark (microseconds since the epoch)
+    """
+    return str(
+        calendar.timegm(timestamp.utctimetuple()) * 1000000 +
+        timestamp.microsecond
+    )
+
+
+def from_watermark(watermark):
+    """
+    watermark -> datetime
+    Raise a validation error if the watermark is malformed
+    """
+    try:
+        return EPOCH + datetime.timedelta(microseconds=int(watermark))
+    except (TypeError, ValueError, OverflowError):
+        raise ValidationError(
+            "Invalid watermark {watermark}".format(watermark=watermark)
+        )
+
+
+def _encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state))
+
+
+def _decode_cursor(token):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(str(token)))
+        return state['watermark'], state['changed'], state['deleted']
+    except (TypeError, ValueError, KeyError):
+        raise ValidationError("Invalid sync cursor {token}".format(
+            token=token
+        ))
+
+
+def _fetch_page(query, page_size, cursor):
+    """
+    Fetch a page of `query` starting at the urlsafe `cursor`
+    Return the results and the urlsafe cursor of the next page
+    (None if there are no more results)
+    """
+    results, next_cursor, more = query.fetch_page(
+        page_size, start_cursor=Cursor(urlsafe=cursor) if cursor else None
+    )
+    return results, next_cursor.urlsafe() if more and next_cursor else None
+
+
+def _get_inequality_properties(node):
+    """
+    Return the names of the properties compared by inequality filters
+    in the filter `node` of a query
+    """
+    if isinstance(node, ndb.FilterNode):
+        name, opsymbol, _ = node.__getnewargs__()
+        return set([name]) if opsymbol in INEQUALITY_OPERATORS else set()
+    if isinstance(node, (ndb.ConjunctionNode, ndb.DisjunctionNode)):
+        return set().union(*(
+            _get_inequality_properties(child) for child in node
+        ))
+    return set()
+
+
+def get_changes(query, sync_property, since, page_size, cursor=None,
+                lag=DEFAULT_LAG):
+    """
+    Return a dict with the entities of `query` whose `sync_property` is
+    later than the watermark `since`, and the ids of the entities of the
+    same kind deleted since then:
+        - `changed`: The changed entities
+        - `deleted`: The ids of the deleted entities
+        - `watermark`: The watermark to sync from once all pages are fetched
+                (`lag` seconds before the start of the sync)
+        - `cursor`: The cursor of the next page (None on the last page)
+    Raise a validation error if `query` has an inequality filter on a
+    property other than `sync_property` (the datastore does not support it)
+    """
+    inequality_properties = _get_inequality_properties(query.filters) - set(
+        [sync_property._name]
+    )
+    if inequality_properties:
+        raise ValidationError(
+            "Delta sync cannot be combined with inequality filters on "
+            "{names}".format(names=', '.join(sorted(inequality_properties)))
+        )
+    if cursor is None:
+        watermark = to_watermark(
+            datetime.datetime.utcnow() - datetime.timedelta(seconds=lag)
+        )
+        changed_cursor = deleted_cursor = ''
+    else:
+        watermark, changed_cursor, deleted_cursor = _decode_cursor(cursor)
+    since = from_watermark(since)
+
+    changed = deleted = []
+    if changed_cursor is not None:
+        changed, changed_cursor = _fetch_page(
+            query.filter(sync_property > since).order(sync_property),
+            page_size, changed_cursor
+        )
+    if deleted_cursor is not None:
+        deleted, deleted_cursor = _fetch_page(
+            Tombstone.query(
+                Tombstone.kind == query.kind, Tombstone.deleted > since
+            ).order(Tombstone.deleted),
+            page_size, deleted_cursor
+        )
+    more = changed_cursor is not None or deleted_cursor is not None
+    return {
+        'changed': changed,
+        'deleted': [tombstone.entity_id for tombstone in deleted],
+        'watermark': watermark,
+        'cursor': _encode_cursor({
+            'watermark': watermark,
+            'changed': changed_cursor,
+            'deleted': deleted_cursor
+        }) if more else None
+    }
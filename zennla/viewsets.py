@@ -2,13 +2,21 @@
 Viewsets club together list and detail views
 providing a clean way of handling requests
 """
+import contextlib
 import json
+import math
+import random
 import webapp2
 import http
 from zennla.renderers import JSONRenderer
 from zennla import exceptions as zennla_exceptions
 
 
+@contextlib.contextmanager
+def _unprofiled():
+    yield
+
+
 class ModelViewSet(webapp2.RequestHandler):
     """
     ModelViewSet can be used to handle requests on a resource level
@@ -17,19 +25,72 @@ class ModelViewSet(webapp2.RequestHandler):
         - `query`: The base query on which all list operations occur
         - `serializer_class`: The serializers.ModelSerializer class
                 which is to be used for serialization
+        - `sync_page_size`: Number of changed (and of deleted) entities
+                returned per page of a delta sync
+        - `sync_lag`: Seconds before the start of a delta sync at which
+                the next one starts, so that it picks up the changes not
+                yet visible to queries (default is `sync.DEFAULT_LAG`)
+        - `coalesce_reads`: If True, concurrent identical GETs share a
+                single computation. Only enable it for resources whose
+                reads do not depend on the requesting user
+        - `coalesce_timeout`: Seconds an identical GET waits for the one
+                in flight before computing its own response
+        - `coalesce_vary_headers`: Request headers which are part of the
+                key identifying identical GETs
+        - `admission_controls`: A dict mapping actions (`list`, `retrieve`,
+                `post`, `put`, `patch`, `delete`) to lists of
+                `admission.AdmissionControl`s applied to their requests.
+                Controls listed under `*` apply to every action
+        - `cache_queries`: If True, the keys matched by list queries are
+                cached in memcache (See: querycache)
+        - `query_cache_timeout`: Seconds a list of keys stays cached
+        - `profile_rate`: Fraction of the requests whose stages are
+                profiled (See: profiling)
     """
     model = None
     serializer_class = None
     filter_backends = []
     renderers = [JSONRenderer]
+    sync_page_size = 100
+    sync_lag = None
+    coalesce_reads = False
+    coalesce_timeout = 10
+    coalesce_vary_headers = ('Accept',)
+    admission_controls = {}
+    cache_queries = False
+    query_cache_timeout = 300
+    profile_rate = 0
 
     def __init__(self, *args, **kwargs):
         super(ModelViewSet, self).__init__(*args, **kwargs)
-        self.media_renderer_map = {
-            renderer.media_type.lower(): renderer
-            for renderer in self.renderers
-        }
-        self.media_renderer_map.update({'*/*': self.renderers[0]})
+        self.media_renderer_map = self.get_media_renderer_map()
+        self.profile = None
+
+    @classmethod
+    def get_media_renderer_map(cls):
+        """
+        Return a dict mapping media types to the renderers of the viewset
+        Computed once per viewset class
+        """
+        if '_media_renderer_map' not in cls.__dict__:
+            media_renderer_map = {
+                renderer.media_type.lower(): renderer
+                for renderer in cls.renderers
+            }
+            media_renderer_map.update({'*/*': cls.renderers[0]})
+            cls._media_renderer_map = media_renderer_map
+        return cls._media_renderer_map
+
+    @classmethod
+    def warmup(cls):
+        """
+        Perform the per-class precomputation of the viewset and load the
+        dependencies of its renderers ahead of its first request
+        Override to warm up anything else (e.g. caches) the viewset uses
+        """
+        cls.get_media_renderer_map()
+        for renderer in cls.renderers:
+            renderer.load()
 
     def dispatch(self):
         """Dispatches the request.
@@ -58,11 +119,12 @@ class ModelViewSet(webapp2.RequestHandler):
         try:
             renderer = self.get_renderer()
         except zennla_exceptions.UnacceptableRequest as e:
-            renderer = self.renderers[0]()
-            self.response.headers['Content-Type'] = renderer.media_type
-            self.response.write(renderer.render(e.detail))
-            self.response.status_int = e.status_code
-            return
+            return self.write_exception(self.renderers[0](), e)
+        try:
+            release = self.admit(method_name, *args, **kwargs)
+        except zennla_exceptions.APIException as e:
+            return self.write_exception(renderer, e)
+        self.profile = self.start_profile()
         try:
             pre_method_handler = getattr(self, 'pre_' + method_name, None)
             if pre_method_handler is not None:
@@ -70,10 +132,7 @@ class ModelViewSet(webapp2.RequestHandler):
             try:
                 response = method(*args, **kwargs)
             except zennla_exceptions.APIException as e:
-                self.response.headers['Content-Type'] = renderer.media_type
-                self.response.write(renderer.render(e.detail))
-                self.response.status_int = e.status_code
-                return
+                return self.write_exception(renderer, e)
             post_method_handler = getattr(self, 'post_' + method_name, None)
             if post_method_handler is not None:
                 post_method_handler(*args, **kwargs)
@@ -81,6 +140,85 @@ class ModelViewSet(webapp2.RequestHandler):
             return response
         except Exception, e:
             return self.handle_exception(e, self.app.debug)
+        finally:
+            release()
+            if self.profile is not None:
+                self.profile.finish()
+
+    def write_exception(self, renderer, e):
+        """
+        Write the APIException `e` to the response using `renderer`
+        """
+        self.response.headers['Content-Type'] = renderer.media_type
+        retry_after = getattr(e, 'retry_after', None)
+        if retry_after is not None:
+            self.response.headers['Retry-After'] = str(
+                int(math.ceil(retry_after))
+            )
+        self.response.write(renderer.render(e.detail))
+        self.response.status_int = e.status_code
+
+    def start_profile(self):
+        """
+        Return a profiling.RequestProfile if the request is sampled to be
+        profiled (See: `profile_rate`), None otherwise
+        """
+        if not self.profile_rate or random.random() >= self.profile_rate:
+            return None
+        from zennla import profiling
+        route = self.request.route
+        return profiling.profiler.start('{method} {route}'.format(
+            method=self.request.method,
+            route=getattr(route, 'name', None) or self.__class__.__name__
+        ))
+
+    def profile_stage(self, name):
+        """
+        Return a context manager measuring the stage `name` of the request
+        if it is profiled (and doing nothing otherwise)
+        """
+        if self.profile is None:
+            return _unprofiled()
+        return self.profile.stage(name)
+
+    def get_action(self, method_name, *args, **kwargs):
+        """
+        Return the name of the action handling the request: `list` or
+        `retrieve` for GET, the name of the handler method otherwise
+        """
+        if method_name == 'get':
+            return 'retrieve' if args or kwargs else 'list'
+        return method_name
+
+    def admit(self, method_name, *args, **kwargs):
+        """
+        Admit the request through the `admission_controls` of its action
+        and the ones listed under `*`
+        Return a callable to be called once the request is handled
+        Raise an APIException if the request is over budget
+        """
+        action = self.get_action(method_name, *args, **kwargs)
+        releases = []
+
+        def release():
+            for release_admission in releases:
+                release_admission()
+
+        try:
+            for scope in (action, '*'):
+                controls = self.admission_controls.get(scope, [])
+                for index, control in enumerate(controls):
+                    releases.append(control.admit(
+                        '{module}.{viewset}:{scope}:{index}'.format(
+                            module=self.__class__.__module__,
+                            viewset=self.__class__.__name__,
+                            scope=scope, index=index
+                        )
+                    ))
+        except zennla_exceptions.APIException:
+            release()
+            raise
+        return release
 
     def filter_query(self, query):
         """
@@ -140,18 +278,97 @@ class ModelViewSet(webapp2.RequestHandler):
         """
         Correspond to HTTP GET
         """
+        if self.coalesce_reads:
+            self.coalesce(self.read, *args, **kwargs)
+        else:
+            self.read(*args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        """
+        Handle GET on either the list or the detail view
+        """
         if args or kwargs:
             self.retrieve(*args, **kwargs)
         else:
             self.list(*args, **kwargs)
 
+    def coalesce(self, handler, *args, **kwargs):
+        """
+        Call `handler`, unless an identical request is already in flight,
+        in which case respond with its status, headers and body instead
+        """
+        computed = []
+
+        def compute():
+            computed.append(True)
+            handler(*args, **kwargs)
+            return (
+                self.response.status_int,
+                self.response.headers.items(),
+                self.response.body
+            )
+
+        from zennla import coalescing
+        key = coalescing.get_request_key(
+            self.request, self.coalesce_vary_headers
+        )
+        status, headers, body = coalescing.read_flights.do(
+            key, compute, self.coalesce_timeout
+        )
+        if not computed:
+            self.response.status_int = status
+            for name, value in headers:
+                if name.lower() != 'content-length':
+                    self.response.headers[name] = value
+            self.response.write(body)
+
     def list(self, *args, **kwargs):
         """
         Handle GET resource-list
         """
+        if 'since' in self.request.GET:
+            return self.sync(*args, **kwargs)
         query = self.filter_query(self.get_query(*args, **kwargs))
         serializer = self.get_serializer_class(*args, **kwargs)()
-        data = serializer.serialize(query)
+        with self.profile_stage('fetch'):
+            if self.cache_queries:
+                from zennla import querycache
+                objs = querycache.fetch(query, self.query_cache_timeout)
+            else:
+                objs = query.fetch()
+        with self.profile_stage('serialize'):
+            data = serializer.serialize(objs)
+        with self.profile_stage('render'):
+            body = self.get_renderer().render(data)
+        with self.profile_stage('write'):
+            self.response.write(body)
+
+    def sync(self, *args, **kwargs):
+        """
+        Handle GET resource-list?since=<watermark>[&cursor=<cursor>]
+        Return a page of the entities changed and the ids of the entities
+        deleted since the watermark
+        """
+        serializer = self.get_serializer_class(*args, **kwargs)()
+        if serializer.sync_field is None:
+            raise zennla_exceptions.ValidationError(
+                "Delta sync is not supported by this resource"
+            )
+        from zennla import sync
+        changes = sync.get_changes(
+            self.filter_query(self.get_query(*args, **kwargs)),
+            getattr(self.get_model(), serializer.sync_field),
+            since=self.request.GET['since'],
+            page_size=self.sync_page_size,
+            cursor=self.request.GET.get('cursor'),
+            lag=sync.DEFAULT_LAG if self.sync_lag is None else self.sync_lag
+        )
+        data = {
+            'results': serializer.serialize(changes['changed']),
+            'deleted': changes['deleted'],
+            'watermark': changes['watermark'],
+            'cursor': changes['cursor']
+        }
         self.response.write(self.get_renderer().render(data))
 
     def retrieve(self, *args, **kwargs):
@@ -159,9 +376,14 @@ class ModelViewSet(webapp2.RequestHandler):
         Handle GET resource-detail
         """
         serializer = self.get_serializer_class(*args, **kwargs)()
-        obj = serializer.get_obj(id=kwargs.values()[0])
-        data = serializer.serialize(obj)
-        self.response.write(self.get_renderer().render(data))
+        with self.profile_stage('fetch'):
+            obj = serializer.get_obj(id=kwargs.values()[0])
+        with self.profile_stage('serialize'):
+            data = serializer.serialize(obj)
+        with self.profile_stage('render'):
+            body = self.get_renderer().render(data)
+        with self.profile_stage('write'):
+            self.response.write(body)
 
     def post(self, *args, **kwargs):
         """
@@ -191,7 +413,7 @@ class ModelViewSet(webapp2.RequestHandler):
         """
         serializer = self.get_serializer_class(*args, **kwargs)()
         obj = serializer.get_obj(id=kwargs.values()[0])
-        obj.key.delete()
+        serializer.delete(obj)
         self.response.status_int = http.HTTP_204_NO_CONTENT
 
     def patch(self, *args, **kwargs):
@@ -214,3 +436,203 @@ class ModelViewSet(webapp2.RequestHandler):
                 "Could not satisfy the request Accept header"
             )
         return renderer_class()
+
+
+class BatchViewSet(ModelViewSet):
+    """
+    BatchViewSet accepts a JSON list of sub-requests, dispatches each of them
+    through the application's own router (without going over the network)
+    and returns a combined response with a status for every sub-request.
+    Each sub-request is a dict with the keys:
+        - `path`: The path (and query string) of the resource
+        - `method`: The HTTP method (default is GET)
+        - `body`: Optional JSON body of the sub-request
+        - `headers`: Optional dict of additional request headers
+    Consecutive GETs are independent and run concurrently; any other method
+    runs on its own, in order, after all the sub-requests before it.
+    The attributes that can be set are:
+        - `max_batch_size`: Maximum number of sub-requests in one batch
+        - `max_workers`: Maximum number of GETs executed concurrently
+        - `forwarded_headers`: Headers of the batch request that are copied
+                to every sub-request
+    """
+    max_batch_size = 50
+    max_workers = 8
+    forwarded_headers = ['Authorization', 'Cookie']
+    allowed_methods = [http.GET, http.POST, http.PUT, http.PATCH, http.DELETE]
+
+    def post(self, *args, **kwargs):
+        """
+        Correspond to HTTP POST
+        """
+        try:
+            sub_requests = json.loads(self.request.body)
+        except ValueError:
+            raise zennla_exceptions.ValidationError(
+                "Batch request body must be a JSON list"
+            )
+        self.validate_sub_requests(sub_requests)
+        self.response.write(
+            self.get_renderer().render(self.execute(sub_requests))
+        )
+
+    def validate_sub_requests(self, sub_requests):
+        """
+        Raise a validation error if `sub_requests` is not a valid batch
+        """
+        if not isinstance(sub_requests, list):
+            raise zennla_exceptions.ValidationError(
+                "Batch request body must be a JSON list"
+            )
+        if len(sub_requests) > self.max_batch_size:
+            raise zennla_exceptions.ValidationError(
+                "A batch can have at most {max_size} sub-requests. "
+                "Found {size} instead".format(
+                    max_size=self.max_batch_size, size=len(sub_requests)
+                )
+            )
+        for index, sub_request in enumerate(sub_requests):
+            self.validate_sub_request(index, sub_request)
+
+    def validate_sub_request(self, index, sub_request):
+        """
+        Raise a validation error if `sub_request` (at `index` in the batch)
+        is not a valid sub-request
+        """
+        if not isinstance(sub_request, dict) or not isinstance(
+            sub_request.get('path'), basestring
+        ) or not sub_request['path'].startswith('/'):
+            raise zennla_exceptions.ValidationError(
+                "Sub-request {index} must be an object with an "
+                "absolute `path`".format(index=index)
+            )
+        if sub_request['path'].split('?')[0] == self.request.path:
+            raise zennla_exceptions.ValidationError(
+                "Sub-request {index} cannot be a batch "
+                "request".format(index=index)
+            )
+        method = sub_request.get('method', http.GET)
+        if not isinstance(method, basestring) or \
+                method.upper() not in self.allowed_methods:
+            raise zennla_exceptions.ValidationError(
+                "Method {method} of sub-request {index} is not "
+                "allowed".format(method=method, index=index)
+            )
+        headers = sub_request.get('headers', {})
+        if not isinstance(headers, dict) or not all(
+            isinstance(value, basestring) for value in headers.itervalues()
+        ):
+            raise zennla_exceptions.ValidationError(
+                "`headers` of sub-request {index} must be an object "
+                "mapping header names to strings".format(index=index)
+            )
+        body = sub_request.get('body')
+        if body is not None and not isinstance(body, (dict, list)):
+            raise zennla_exceptions.ValidationError(
+                "`body` of sub-request {index} must be a JSON object "
+                "or list".format(index=index)
+            )
+
+    def execute(self, sub_requests):
+        """
+        Execute the `sub_requests` and return a list of their responses
+        Runs of consecutive GETs are executed concurrently
+        """
+        responses = []
+        pending_reads = []
+        for sub_request in sub_requests:
+            if sub_request.get('method', http.GET).upper() == http.GET:
+                pending_reads.append(sub_request)
+                continue
+            responses.extend(self._execute_many(pending_reads))
+            pending_reads = []
+            responses.extend(self._execute_many([sub_request]))
+        responses.extend(self._execute_many(pending_reads))
+        return responses
+
+    def _execute_many(self, sub_requests):
+        from zennla import concurrency
+        try:
+            return concurrency.map_concurrently(
+                self.execute_one, sub_requests, max_workers=self.max_workers
+            )
+        finally:
+            # Dispatching through the application resets its request globals
+            self.request.app.set_globals(
+                app=self.request.app, request=self.request
+            )
+
+    def execute_one(self, sub_request):
+        """
+        Dispatch a single `sub_request` through the application
+        Return a dict with the `status` and `body` of its response
+        """
+        request = webapp2.Request.blank(
+            sub_request['path'],
+            base_url=self.request.host_url,
+            method=str(sub_request.get('method', http.GET).upper())
+        )
+        for header in self.forwarded_headers:
+            if header in self.request.headers:
+                request.headers[header] = self.request.headers[header]
+        for header, value in sub_request.get('headers', {}).iteritems():
+            request.headers[header.encode('utf-8')] = value.encode('utf-8')
+        if sub_request.get('body') is not None:
+            request.body = json.dumps(sub_request['body'])
+            request.content_type = JSONRenderer.media_type
+        response = request.get_response(self.request.app)
+        body = response.body or None
+        if body and response.content_type == JSONRenderer.media_type:
+            body = json.loads(body)
+        return {
+            'path': sub_request['path'],
+            'status': response.status_int,
+            'body': body
+        }
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    """
+    Handles App Engine warmup requests by importing every viewset routed in
+    the application (including the ones routed lazily by their import path)
+    and calling their `warmup()`
+    """
+    def get(self):
+        for route in self.app.router.match_routes:
+            for sub_route in route.get_routes():
+                handler = getattr(sub_route, 'handler', None)
+                if isinstance(handler, basestring):
+                    handler = webapp2.import_string(handler)
+                if isinstance(handler, type) and issubclass(
+                    handler, ModelViewSet
+                ):
+                    handler.warmup()
+
+
+class ProfilingHandler(webapp2.RequestHandler):
+    """
+    Shows the profiling measurements of the instance serving the request
+    (GET) or discards them (DELETE). Only available to admins of the app.
+    """
+    def dispatch(self):
+        from google.appengine.api import users
+        if not users.is_current_user_admin():
+            renderer = JSONRenderer()
+            self.response.headers['Content-Type'] = renderer.media_type
+            self.response.write(renderer.render(
+                {'detail': "Only admins can access profiling data"}
+            ))
+            self.response.status_int = http.HTTP_403_FORBIDDEN
+            return
+        return super(ProfilingHandler, self).dispatch()
+
+    def get(self):
+        from zennla import profiling
+        renderer = JSONRenderer()
+        self.response.headers['Content-Type'] = renderer.media_type
+        self.response.write(renderer.render(profiling.profiler.get_stats()))
+
+    def delete(self):
+        from zennla import profiling
+        profiling.profiler.reset()
+        self.response.status_int = http.HTTP_204_NO_CONTENT
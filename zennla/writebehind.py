@@ -0,0 +1,440 @@
+"""
+Write-behind buffers updates to existing entities in the instance's memory
+and writes them to the datastore in batches, so that entities receiving
+very frequent updates (counters, status fields) stay within the datastore's
+write rate per entity group.
+Updates to the same field of the same entity are merged with a merge
+function: `last_write_wins` (the default) or `additive`.
+Buffers are flushed by a background thread and when the instance shuts
+down. Background threads require manual or basic scaling: with automatic
+scaling, buffering an update raises ImproperlyConfigured.
+Pending updates are shared with the other instances through memcache, so
+that reads served by any instance include them.
+"""
+import logging
+import threading
+import time
+import uuid
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+from zennla.exceptions import ImproperlyConfigured
+
+# Maximum number of entity groups in a cross-group transaction
+MAX_TRANSACTION_GROUPS = 25
+
+# Prefix of the memcache keys sharing the pending updates of an entity
+MEMCACHE_PREFIX = 'zennla:writebehind:'
+
+# Seconds after `max_delay` past which the shared updates of a buffer are
+# ignored, e.g. when its instance stopped without flushing them
+SHARED_GRACE = 30
+
+# Attempts to update the shared updates of an entity before removing them
+MAX_SHARE_ATTEMPTS = 5
+
+# Buffers of the instance, flushed when it shuts down
+_buffers = []
+_buffers_lock = threading.Lock()
+_previous_shutdown_hook = None
+
+
+def last_write_wins(current, value):
+    """
+    Merge function keeping the latest value
+    """
+    return value
+
+
+def additive(current, value):
+    """
+    Merge function adding the value to the current one
+    """
+    return (current or 0) + value
+
+
+class WriteBehindBuffer(object):
+    """
+    Buffers updates to entities and flushes them in batches with `put_multi`
+    Flushes happen when `max_pending` entities have pending updates or
+    when the oldest pending update is more than `max_delay` seconds old.
+    Pending updates are held in the instance's memory, and lost if the
+    instance stops without running its shutdown hook. They are also shared
+    in memcache, where `get` reads the updates pending in other instances:
+    merge functions must be module-level functions, so they can be pickled.
+    """
+    def __init__(self, max_pending=100, max_delay=1.0):
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self._id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pending = {}
+        self._oldest = None
+        # Time of the last update buffered to each entity
+        self._updated = {}
+        # Keys of the updates being written by a flush
+        self._flushing = set()
+        # Number of flushes started, which tells readers of the shared
+        # updates that some of them may have been written
+        self._flushes = 0
+        # Version of the shared updates, so that an older version never
+        # replaces a newer one
+        self._version = 0
+        self._flusher_started = False
+        self._stopped = threading.Event()
+
+    def add(self, key, updates):
+        """
+        Buffer the `updates` to the entity at `key`
+        `updates` is a dict mapping field names to (merge function, value)
+        Raises ImproperlyConfigured if no thread can be started to flush
+        the buffer
+        """
+        with self._start_lock:
+            if not self._flusher_started:
+                self._start_flusher()
+                _register(self)
+                self._flusher_started = True
+        with self._lock:
+            pending = self._pending.setdefault(key, {})
+            for name, (merge, value) in updates.iteritems():
+                if name in pending:
+                    value = merge(pending[name][1], value)
+                pending[name] = (merge, value)
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._updated[key] = time.time()
+            shared = self._get_shared_updates([key])
+        self._share(shared)
+        self.flush_if_due()
+
+    def get(self, key):
+        """
+        Return the entity at `key` with the updates pending in this and
+        other instances applied (None if it does not exist)
+        Waits while the updates to the entity are being written
+        """
+        while True:
+            with self._lock:
+                flushing = key in self._flushing
+                updates = self._pending.get(key)
+            others = None if flushing else self._get_other_updates(key)
+            if others is not None:
+                obj = key.get(use_cache=False)
+                # Retry if a flush took updates while the entity was
+                # fetched, as they may not be written yet
+                latest = self._get_other_updates(key)
+                if latest is not None and _get_flushes(latest) == \
+                        _get_flushes(others):
+                    with self._lock:
+                        if key not in self._flushing and (
+                            updates is None or
+                            self._pending.get(key) is updates
+                        ):
+                            if obj is not None:
+                                _apply_shared_updates(obj, latest + [{
+                                    'updated': self._updated.get(key, 0),
+                                    'pending': self._pending.get(key, {})
+                                }])
+                            return obj
+            time.sleep(0.01)
+
+    def is_due(self):
+        """
+        Return True if the pending updates should be flushed
+        """
+        with self._lock:
+            return bool(self._pending) and (
+                len(self._pending) >= self.max_pending or
+                time.time() - self._oldest >= self.max_delay
+            )
+
+    def flush_if_due(self):
+        """
+        Flush the pending updates if they are due
+        """
+        if self.is_due():
+            self.flush()
+
+    def flush(self):
+        """
+        Write all the pending updates to the datastore
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._oldest = None
+                self._flushing.update(pending)
+                self._flushes += 1
+                shared = self._get_shared_updates(pending)
+            self._share(shared)
+            keys = pending.keys()
+            try:
+                while keys:
+                    batch = keys[:MAX_TRANSACTION_GROUPS]
+                    _write_updates(batch, pending)
+                    _invalidate_queries(batch, pending)
+                    keys = keys[MAX_TRANSACTION_GROUPS:]
+                    with self._lock:
+                        self._flushing.difference_update(batch)
+                        shared = self._get_shared_updates(batch)
+                    self._share(shared)
+            except Exception:
+                self._requeue(dict((key, pending[key]) for key in keys))
+                raise
+            finally:
+                with self._lock:
+                    keys, self._flushing = self._flushing, set()
+                    shared = self._get_shared_updates(keys)
+                self._share(shared)
+
+    def _requeue(self, pending):
+        """
+        Put back the `pending` updates of a failed flush, before any
+        update buffered since
+        """
+        with self._lock:
+            for key, updates in pending.iteritems():
+                newer = self._pending.get(key, {})
+                for name, (merge, value) in newer.iteritems():
+                    if name in updates:
+                        value = merge(updates[name][1], value)
+                    updates[name] = (merge, value)
+                self._pending[key] = updates
+            if self._pending and self._oldest is None:
+                self._oldest = time.time()
+
+    def _get_shared_updates(self, keys):
+        """
+        Return the state of the buffer for each of `keys`, as shared with
+        the other instances
+        Called with the lock held
+        """
+        shared = {}
+        now = time.time()
+        for key in list(keys):
+            pending = self._pending.get(key)
+            flushing = key in self._flushing
+            self._version += 1
+            shared[key] = {
+                'version': self._version,
+                'flushes': self._flushes,
+                'flushing': flushing,
+                'updated': self._updated.get(key, now),
+                'pending': dict(pending or {}),
+                'expires': now + self.max_delay + SHARED_GRACE
+            }
+            if not pending and not flushing:
+                self._updated.pop(key, None)
+        return shared
+
+    def _get_other_updates(self, key):
+        """
+        Return the updates to `key` shared by the other buffers, or None if
+        some of them are being written
+        """
+        shared = memcache.get(MEMCACHE_PREFIX + key.urlsafe()) or {}
+        others = [
+            dict(state, buffer=buffer_id)
+            for buffer_id, state in _prune(shared).iteritems()
+            if buffer_id != self._id
+        ]
+        if any(state['flushing'] for state in others):
+            return None
+        return others
+
+    def _share(self, shared):
+        """
+        Store the `shared` states of the buffer in memcache, keeping the
+        states of the other buffers
+        If memcache cannot be updated, remove the shared updates altogether
+        rather than leaving outdated ones
+        """
+        client = memcache.Client()
+        keys = dict(
+            (MEMCACHE_PREFIX + key.urlsafe(), key) for key in shared
+        )
+        for _ in range(MAX_SHARE_ATTEMPTS):
+            if not keys:
+                return
+            current = client.get_multi(keys.keys(), for_cas=True)
+            added, replaced = {}, {}
+            for memcache_key, key in keys.items():
+                states = _prune(current.get(memcache_key) or {})
+                state = states.get(self._id)
+                if state is not None and \
+                        state['version'] >= shared[key]['version']:
+                    del keys[memcache_key]
+                    continue
+                states[self._id] = shared[key]
+                if memcache_key in current:
+                    replaced[memcache_key] = states
+                else:
+                    added[memcache_key] = states
+            try:
+                failed = client.add_multi(added, time=_get_ttl(added)) + \
+                    client.cas_multi(replaced, time=_get_ttl(replaced))
+            except Exception:
+                logging.exception("Could not share write-behind updates")
+                break
+            for memcache_key in set(keys) - set(failed):
+                del keys[memcache_key]
+        if keys and not memcache.delete_multi(keys.keys()):
+            logging.error(
+                "Could not remove the shared write-behind updates of %s",
+                keys.values()
+            )
+
+    def stop(self):
+        """
+        Stop the background thread flushing the buffer
+        """
+        self._stopped.set()
+
+    def _get_flush_delay(self):
+        """
+        Return the number of seconds until the pending updates are due
+        """
+        with self._lock:
+            if self._oldest is None:
+                return self.max_delay
+            return max(self._oldest + self.max_delay - time.time(), 0.01)
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self._get_flush_delay()):
+            try:
+                self.flush_if_due()
+            except Exception:
+                logging.exception("Could not flush write-behind updates")
+
+    def _start_flusher(self):
+        """
+        Start the thread flushing the buffer every `max_delay` seconds
+        It is a background thread on App Engine, where it needs manual or
+        basic scaling, and a daemon thread elsewhere (e.g. in tests)
+        """
+        from google.appengine.api import background_thread
+        try:
+            background_thread.start_new_background_thread(
+                self._flush_periodically, []
+            )
+        except background_thread.Error:
+            raise ImproperlyConfigured(
+                "Write-behind needs a background thread to flush updates, "
+                "which requires manual or basic scaling"
+            )
+        except Exception:
+            # No background thread service (e.g. in tests)
+            thread = threading.Thread(target=self._flush_periodically)
+            thread.daemon = True
+            thread.start()
+
+
+def _register(buffer):
+    """
+    Add `buffer` to the buffers flushed when the instance shuts down
+    Called when the first update is buffered
+    """
+    global _previous_shutdown_hook
+    with _buffers_lock:
+        if not _buffers:
+            from google.appengine.api import runtime
+            _previous_shutdown_hook = runtime.set_shutdown_hook(
+                _shutdown_hook
+            )
+        _buffers.append(buffer)
+
+
+def flush_all():
+    """
+    Flush the pending updates of all the buffers of the instance
+    """
+    with _buffers_lock:
+        buffers = list(_buffers)
+    for buffer in buffers:
+        try:
+            buffer.flush()
+        except Exception:
+            logging.exception("Could not flush write-behind updates")
+
+
+def _shutdown_hook():
+    with _buffers_lock:
+        buffers = list(_buffers)
+    for buffer in buffers:
+        buffer.stop()
+    flush_all()
+    if _previous_shutdown_hook is not None:
+        _previous_shutdown_hook()
+
+
+def _prune(states):
+    """
+    Remove the expired states from the shared `states` of an entity
+    """
+    now = time.time()
+    return dict(
+        (buffer_id, state) for buffer_id, state in states.iteritems()
+        if state['expires'] > now
+    )
+
+
+def _get_ttl(records):
+    """
+    Return the memcache expiration time of the shared `records`
+    """
+    expires = [
+        state['expires']
+        for states in records.itervalues() for state in states.itervalues()
+    ]
+    return max(int(max(expires) - time.time()) + 1, 1) if expires else 0
+
+
+def _get_flushes(states):
+    """
+    Return the number of flushes started by each buffer of `states`
+    """
+    return dict((state['buffer'], state['flushes']) for state in states)
+
+
+def _apply_shared_updates(obj, states):
+    """
+    Merge the pending updates of all the `states` into `obj`, the most
+    recently updated last
+    """
+    for state in sorted(states, key=lambda state: state['updated']):
+        apply_updates(obj, state['pending'])
+    return obj
+
+
+def apply_updates(obj, updates):
+    """
+    Merge the `updates` into the model object `obj`
+    """
+    for name, (merge, value) in updates.iteritems():
+        setattr(obj, name, merge(getattr(obj, name), value))
+    return obj
+
+
+def _invalidate_queries(keys, pending):
+    """
+    Invalidate the cached queries depending on the properties updated by
+    the written `pending` updates of `keys` (See: querycache)
+    """
+    from zennla import querycache
+    names = {}
+    for key in keys:
+        names.setdefault(key.kind(), set()).update(pending[key])
+    for kind, kind_names in names.iteritems():
+        querycache.invalidate_properties(kind, kind_names)
+
+
+@ndb.transactional(xg=True)
+def _write_updates(keys, pending):
+    objs = [
+        apply_updates(obj, pending[obj.key])
+        for obj in ndb.get_multi(keys, use_cache=False)
+        if obj is not None
+    ]
+    ndb.put_multi(objs)